@@ -1,4 +1,7 @@
+import io
 import pygame as pg
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 import xml.etree.ElementTree as ET
 
@@ -8,14 +11,26 @@ class Img_Loader():
         self.game = game
         self.assets = {}
         self.sprite_sheets = []
+        self.index = {} # file name prefix -> file path
+        self.sheet_index = {} # sprite name -> sprite sheet
+        self.preloaded = {} # file path -> surface decoded by the preloader
 
-        # load sprite sheets
+        # scan img_path once, loading sprite sheets and indexing images
         img_path = Path(self.game.config.img_pathX)
-        for file_path in img_path.glob("*"):
+        for file_path in sorted(img_path.glob("*")):
             file_name = file_path.as_posix()
             if file_name.endswith(".xml"):
                 # create a sprite sheet object for each xml file in img_path
-                self.sprite_sheets.append(Sprite_Sheet(game, file_name[:-4]))
+                sheet = Sprite_Sheet(game, file_name[:-4])
+                self.sprite_sheets.append(sheet)
+                for sprite_name in sheet.sprite_coords.keys():
+                    self.sheet_index.setdefault(sprite_name, sheet)
+            else:
+                # index every prefix of the file name so lookups match the
+                # names used in game, eg "main background" or "Gold.png"
+                name = file_path.name
+                for i in range(1, len(name) + 1):
+                    self.index.setdefault(name[:i], file_path)
 
     def get(self, img_name):
         image = False
@@ -28,14 +43,11 @@ class Img_Loader():
             image = loaded_img
 
         # try to find sprite in spritesheets
-        else:
-            for sheet in self.sprite_sheets:
-                if loaded_image := sheet.get(img_name):
-                    # when we find an image, stop looking
-                    image = loaded_image
-                    break
+        elif img_name in self.sheet_index.keys():
+            image = self.sheet_index[img_name].get(img_name)
 
-        # sprite cant be found
+        # sprite cant be found; the placeholder is cached below so missing
+        # names are only looked up once
         if not(image):
             image = pg.surface.Surface((10, 10)).convert_alpha()
             image.fill((255, 0, 255))
@@ -45,14 +57,14 @@ class Img_Loader():
         return image
 
     def load(self, img_name):
-        # search img_path for images
-        img_path = Path(self.game.config.img_pathX)
-        # iterate through files in img_path
-        for file_path in img_path.glob("*"):
-            if file_path.name.startswith(img_name):
-                # if the names match, load image and return it
-                image = pg.image.load(file_path.as_posix()).convert_alpha()
-                return image
+        # look the name up in the file index
+        if img_name in self.index.keys():
+            # if the names match, load image and return it
+            file_path = self.index[img_name]
+            if file_path in self.preloaded.keys():
+                return self.preloaded[file_path]
+            image = pg.image.load(file_path.as_posix()).convert_alpha()
+            return image
 
         # no image was found
         return False
@@ -63,6 +75,16 @@ class Snd_Loader():
         self.game = game
         self.assets = {}
         self.load_vol = 1
+        self.index = {} # file name prefix -> file path
+        self.preloaded = {} # file path -> sound decoded by the preloader
+
+        # index all files in snd_path and its sub folders
+        snd_path = Path(self.game.config.snd_pathX)
+        for file_path in sorted(snd_path.rglob("*")):
+            if file_path.is_file():
+                name = file_path.name
+                for i in range(1, len(name) + 1):
+                    self.index.setdefault(name[:i], file_path)
 
     def get(self, snd_name):
         # check in assets
@@ -84,14 +106,16 @@ class Snd_Loader():
                 input()
 
     def load(self, snd_name):
-        snd_path = Path(self.game.config.snd_pathX)
-        # iterate through all files in snd_path
-        for file_path in snd_path.rglob("*"):
-            if file_path.name.startswith(snd_name):
-                # return the sound if it has the correct name
+        # look the name up in the file index
+        if snd_name in self.index.keys():
+            # return the sound if it has the correct name
+            file_path = self.index[snd_name]
+            if file_path in self.preloaded.keys():
+                snd = self.preloaded[file_path]
+            else:
                 snd = pg.mixer.Sound(file_path.as_posix())
-                snd.set_volume(self.load_vol)
-                return snd
+            snd.set_volume(self.load_vol)
+            return snd
 
     def set_all_vol(self):
         # set default volume
@@ -101,6 +125,169 @@ class Snd_Loader():
             snd.set_volume(self.game.config.game_vol)
 
 
+class Music_Channel():
+    """streams background music through pg.mixer.music rather than decoding
+    whole tracks into Sounds"""
+    def __init__(self, game, playlist):
+        self.game = game
+        self.playlist = playlist
+        self.index = -1
+        self.volume = 1
+
+        # pg.mixer.music posts this event when a track ends or fades out
+        self.end_event = pg.event.custom_type()
+        pg.mixer.music.set_endevent(self.end_event)
+
+    def play(self):
+        """starts the playlist from the first track"""
+        self.index = -1
+        self.next()
+
+    def next(self):
+        """fades in the next track in the playlist"""
+        # try each track once, skipping any which can't be found
+        for _ in range(len(self.playlist)):
+            self.index = (self.index + 1) % len(self.playlist)
+            track_name = self.playlist[self.index]
+            if track_name not in self.game.snd_loader.index.keys():
+                print(f"failed to find music track {track_name}")
+                continue
+
+            file_path = self.game.snd_loader.index[track_name]
+            pg.mixer.music.load(file_path.as_posix())
+            pg.mixer.music.set_volume(self.volume)
+            # a single track loops forever rather than restarting on its end
+            # event
+            loops = -1 if len(self.playlist) == 1 else 0
+            pg.mixer.music.play(loops, fade_ms=self.game.config.music_fade_ms)
+            return
+
+    def skip(self):
+        """fades out the current track; the next one fades in when the end
+        event arrives"""
+        pg.mixer.music.fadeout(self.game.config.music_fade_ms)
+
+    def handle_event(self, event):
+        if event.type == self.end_event:
+            self.next()
+
+    def set_volume(self, vol):
+        self.volume = vol
+        pg.mixer.music.set_volume(vol)
+
+
+class Font_Loader():
+    """shared registry of fonts keyed by (font file, point size), each font
+    file is only read from disk once"""
+    font_suffixes = [".ttf", ".otf"]
+
+    def __init__(self, game):
+        self.game = game
+        self.assets = {} # (font name, point size) -> font
+        self.point_sizes = {} # (font name, pixel height) -> point size
+        self.file_bytes = {} # file path -> font file contents, read once
+
+        # index the font files in img_path
+        self.index = {}
+        for file_path in sorted(Path(self.game.config.img_pathX).glob("*")):
+            if file_path.suffix.lower() in self.font_suffixes:
+                self.index[file_path.name] = file_path
+
+    def read(self, font_name):
+        """returns (bytes) the contents of a font file"""
+        file_path = self.index.get(font_name,
+                                   Path(self.game.config.img_pathX) / font_name)
+        if file_path not in self.file_bytes.keys():
+            self.file_bytes[file_path] = file_path.read_bytes()
+        return self.file_bytes[file_path]
+
+    def get(self, font_name, size=20):
+        key = (font_name, size)
+        if key not in self.assets.keys():
+            # every font needs its own file object to read from
+            font_file = io.BytesIO(self.read(font_name))
+            self.assets[key] = pg.font.Font(font_file, size)
+        return self.assets[key]
+
+    def get_for_height(self, font_name, height):
+        """returns (font) the size of font_name whose lines render closest to
+        height pixels tall, so text doesn't need upscaling"""
+        height = max(1, round(height))
+        key = (font_name, height)
+        if key not in self.point_sizes.keys():
+            # line height grows in proportion to point size; tiny sizes
+            # can't render glyphs, so those are scaled down instead
+            base_font = self.get(font_name)
+            size = round(20 * height / base_font.get_height())
+            self.point_sizes[key] = max(8, size)
+        return self.get(font_name, self.point_sizes[key])
+
+
+class Preloader():
+    """decodes the assets some screens load on a thread pool before the
+    screens are built; SDL releases the GIL while decoding"""
+    def __init__(self, game, screen_classes):
+        self.game = game
+        self.screen_classes = screen_classes
+        self.load_times = {}
+
+    def build_manifest(self):
+        """returns (list) of (loader, file path) for every asset the screens
+        load which hasn't been decoded yet"""
+        manifest = []
+        for loader, attr in [(self.game.img_loader, "img_names"),
+                             (self.game.snd_loader, "snd_names")]:
+            names = {name for screen_class in self.screen_classes
+                     for name in getattr(screen_class, attr)}
+            for name in sorted(names):
+                file_path = loader.index.get(name)
+                if file_path is not None and \
+                   file_path not in loader.preloaded.keys() and \
+                   (loader, file_path) not in manifest:
+                    manifest.append((loader, file_path))
+        return manifest
+
+    def decode(self, loader, file_path):
+        """runs on a worker thread, returns (asset, seconds taken)"""
+        start = time.perf_counter()
+        if loader is self.game.img_loader:
+            asset = pg.image.load(file_path.as_posix())
+        else:
+            asset = pg.mixer.Sound(file_path.as_posix())
+        return asset, time.perf_counter() - start
+
+    def run(self):
+        start = time.perf_counter()
+        manifest = self.build_manifest()
+
+        workers = self.game.config.preload_workers
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(self.decode, loader, file_path):
+                       (loader, file_path) for loader, file_path in manifest}
+
+            for future in as_completed(futures):
+                loader, file_path = futures[future]
+                try:
+                    asset, seconds = future.result()
+                except Exception as error:
+                    print(f"failed to preload {file_path.name}: {error}")
+                    continue
+
+                # surfaces can only be converted on the main thread
+                if loader is self.game.img_loader:
+                    asset = asset.convert_alpha()
+                loader.preloaded[file_path] = asset
+                self.load_times[file_path.name] = seconds
+
+        # report load times, slowest first
+        if self.game.config.preload_report:
+            for name, seconds in sorted(self.load_times.items(),
+                                        key=lambda item: -item[1]):
+                print(f"preloaded {name} in {seconds * 1000:.1f}ms")
+        print(f"preloaded {len(self.load_times)} assets in "
+              f"{(time.perf_counter() - start) * 1000:.1f}ms")
+
+
 class Sprite_Sheet():
     def __init__(self, game, sheet_path):
         self.game = game
@@ -0,0 +1,175 @@
+"""reproducible headless benchmarks for the slow parts of the game, run with:
+python Benchmark.py [--output results.json]
+results go to stdout as json; the game's own log lines go to stderr"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random as rng
+import sys
+import time
+
+# benchmarks never open a real window or audio device
+os.environ["SDL_VIDEODRIVER"] = "dummy"
+os.environ["SDL_AUDIODRIVER"] = "dummy"
+# keep stdout for the results
+os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+
+import pygame as pg
+import Main
+import Maze_Gen as mg
+import Menu_System as MSYS
+import Sprites as sprites
+
+SEED = 0
+
+
+def timed(func, repeats):
+    """returns (float) the best time in seconds of repeats calls to func"""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_maze_generation(sizes, seed=SEED):
+    """returns (dict) maze size -> seconds taken by Maze.generate_layout and
+    Maze.get_shortest_path"""
+    results = {}
+    for size in sizes:
+        maze = mg.Maze(None, (size, size), seed)
+        rng.seed(maze.seed)
+
+        start = time.perf_counter()
+        maze.generate_layout()
+        layout_time = time.perf_counter() - start
+
+        maze.layout_to_board()
+        path_end = [maze.end[0]-1, maze.end[1]]
+        path_time = timed(lambda: maze.get_shortest_path(maze.start, path_end),
+                          3)
+
+        results[f"{size}x{size}"] = {"generate_layout": layout_time,
+                                     "get_shortest_path": path_time}
+    return results
+
+
+def start_level(game, level_no=1):
+    rng.seed(SEED)
+    game.level_no = level_no
+    game.game_state_stack = [game.main_screen.tick]
+    game.start_level()
+    return game.level
+
+
+def bench_render(game, zooms, frames=200):
+    """returns (dict) camera zoom -> Renderable_Sprite.render calls per second"""
+    results = {}
+    for zoom in zooms:
+        level = start_level(game)
+        level.camera.zoom = zoom
+        level.rescale()
+        level_sprites = level.all_sprites.sprites()
+
+        def render_all():
+            for _ in range(frames):
+                for sprite in level_sprites:
+                    sprite.render(16)
+
+        seconds = timed(render_all, 3)
+        results[str(zoom)] = len(level_sprites) * frames / seconds
+    return results
+
+
+def bench_level_tick(game, asteroid_counts, resource_counts, frames=200):
+    """returns (dict) "Nx M" -> seconds per Level.tick with N asteroids and M
+    resources in play"""
+    results = {}
+    for asteroid_count in asteroid_counts:
+        for resource_count in resource_counts:
+            level = start_level(game)
+
+            # top up the level to the requested counts
+            for _ in range(asteroid_count - len(level.asteroids)):
+                ast = sprites.Asteroid(game)
+                level.asteroids.add(ast)
+                level.all_sprites.add(ast)
+            for _ in range(resource_count):
+                pos = (rng.random() * 8 + 1, rng.random() * 3 + 1)
+                vel = pg.math.Vector2(rng.random() - 0.5, rng.random() - 0.5)
+                level.resource_pool.fire(pos, vel * 0.1)
+
+            # stop the level ending part way through
+            level.time_left = 10 ** 9
+            level.hits = -10 ** 9
+
+            start = time.perf_counter()
+            for _ in range(frames):
+                level.tick([], 16)
+            seconds = (time.perf_counter() - start) / frames
+
+            results[f"{asteroid_count}x{resource_count}"] = seconds
+    return results
+
+
+def bench_ui_rescale(game, repeats=20):
+    """returns (dict) screen name -> seconds per Ui_Screen.rescale"""
+    screens = {
+        "main": game.main_screen,
+        "start": game.start_screen,
+        "level_clear": MSYS.Level_clear(game, 1),
+        "fail": game.fail_screen,
+        "end": game.end_screen,
+        "pause": game.pause_screen,
+    }
+    return {name: timed(screen.rescale, repeats)
+            for name, screen in screens.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", help="file to write the json results to")
+    parser.add_argument("--quick", action="store_true",
+                        help="only run the smaller sizes")
+    args = parser.parse_args()
+
+    maze_sizes = [10, 25, 50] if args.quick else [10, 25, 50, 100, 250, 500]
+
+    # the game logs to stdout, so send that to stderr while benchmarking
+    with contextlib.redirect_stdout(sys.stderr):
+        results = run_benchmarks(maze_sizes)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output)
+    print(output)
+
+
+def run_benchmarks(maze_sizes):
+    """returns (dict) the results of every benchmark"""
+    game = Main.Game(headless=True, render=True, autorun=False)
+
+    results = {
+        "meta": {
+            "seed": SEED,
+            "python": sys.version.split()[0],
+            "pygame": pg.version.ver,
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "maze_generation": bench_maze_generation(maze_sizes),
+        "render_per_second": bench_render(game, [1, 5, 10, 20]),
+        "level_tick": bench_level_tick(game, [16, 64, 256], [0, 64, 256]),
+        "ui_rescale": bench_ui_rescale(game),
+    }
+
+    pg.quit()
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import random
+import pygame as pg
+
+
+class Live_Input():
+    """input read from pygame's event queue and mouse"""
+    def __init__(self):
+        self.waited_events = [] # events taken off the queue while waiting
+
+    def get_events(self):
+        events = self.waited_events + pg.event.get()
+        self.waited_events = []
+        return events
+
+    def wait(self, timeout):
+        """blocks until an event arrives or timeout (ms) passes"""
+        event = pg.event.wait(timeout)
+        if event.type != pg.NOEVENT:
+            self.waited_events.append(event)
+
+    def get_mouse_pos(self):
+        return pg.mouse.get_pos()
+
+    def get_mouse_pressed(self):
+        return pg.mouse.get_pressed()
+
+
+class Scripted_Input():
+    """deterministic input for headless runs: aims the cannon at the other
+    ship, with some jitter, and clicks every fire_interval frames"""
+    def __init__(self, game, seed=0, fire_interval=10, jitter=40):
+        self.game = game
+        self.rng = random.Random(seed)
+        self.fire_interval = fire_interval
+        self.jitter = jitter
+        self.frame_no = 0
+        self.mouse_pos = (0, 0)
+
+    def get_events(self):
+        # called once per frame, so it also advances the script
+        self.frame_no += 1
+
+        # aim at the other ship when there is a level
+        if (level := self.game.level) and hasattr(level, "ship_2"):
+            target = level.ship_2.rect.center
+            self.mouse_pos = (target[0] + self.rng.uniform(-1, 1) * self.jitter,
+                              target[1] + self.rng.uniform(-1, 1) * self.jitter)
+        return []
+
+    def wait(self, timeout):
+        # scripted input never idles
+        pass
+
+    def get_mouse_pos(self):
+        return self.mouse_pos
+
+    def get_mouse_pressed(self):
+        # hold the left button for the first frame of every interval
+        return (self.frame_no % self.fire_interval == 0, False, False)
@@ -0,0 +1,31 @@
+import random
+
+# weighting of asteroid images, matching Asteroid.possible_imgs
+asteroid_img_names = ["Evil Asteroid.png"]   * 1 + \
+                     ["Girder Deb.png"]      * 1 + \
+                     ["Minidebs.png"]        * 2 + \
+                     ["Ministorid.png"]      * 3
+
+
+class Level_Plan():
+    """the pure data parts of a level, which don't depend on pygame"""
+    def __init__(self, level_no, asteroid_spawns):
+        self.level_no = level_no
+        # (x, y, y velocity, rotation velocity, image index) per asteroid
+        self.asteroid_spawns = asteroid_spawns
+
+
+def build_level_plan(level_no, seed, asteroid_count):
+    """returns (Level_Plan) for a level"""
+    level_rng = random.Random(seed)
+
+    # same distributions as Asteroid.respawn
+    asteroid_spawns = []
+    for _ in range(asteroid_count):
+        asteroid_spawns.append((level_rng.random() * 2 + 4, -1,
+                                level_rng.random() * 2 + 1,
+                                level_rng.randrange(-90, 90),
+                                level_rng.randrange(len(asteroid_img_names))))
+
+    return Level_Plan(level_no, asteroid_spawns)
+
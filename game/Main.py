@@ -1,93 +1,344 @@
+import argparse
+import os
+import random as rng
+import time
 import pygame as pg
 import config as cfg
 import Asset_Loader as AL
+import Input_Source as IS
+import Level_Gen as LG
+import Profiler as PF
+import Menu_Sprites as MS
 import Menu_System as MSYS
 
 class Game():
-    def __init__(self):
+    # screens are built the first time they're used, in this warm up order
+    screen_classes = {"main": MSYS.Main, "start": MSYS.Start,
+                      "pause": MSYS.Pause, "fail": MSYS.Fail, "end": MSYS.End}
+
+    def __init__(self, headless=False, level_count=1, render=False,
+                 profile=False, autorun=True):
+        # time each step of startup
+        self.startup_times = {}
+        self.startup_last = time.perf_counter()
+        self.startup_begin = self.startup_last
+
         self.game_state_stack = []
+        self.screens = {}
+        # screens which need rescaling before they're next shown
+        self.stale_screens = set()
+        # window size from the latest resize event, applied once it settles
+        self.pending_size = None
+        self.resize_time = 0
+        # the screen shown last frame, a newly shown screen is drawn in full
+        self.last_tick = None
+        self.full_redraw = True
+        self.dirty_rects = None # None presents the whole frame
+
+        # headless runs have no window or sound and are driven by a script
+        self.headless = headless
+        self.render_enabled = render or not headless
+        if headless:
+            os.environ["SDL_VIDEODRIVER"] = "dummy"
+            os.environ["SDL_AUDIODRIVER"] = "dummy"
 
         # init pygame env
         pg.init()
         pg.mixer.init()
+        self.startup_step("pygame")
 
         # init config
         self.config = cfg.Config()
 
+        # init profiler
+        self.profiler = PF.Profiler(self)
+        self.profiler.dump_traces = profile
+
         # init video
         self.set_screen()
+        self.startup_step("video")
+
+        # init input
+        if headless:
+            self.input = IS.Scripted_Input(self, self.config.headless_seed)
+        else:
+            self.input = IS.Live_Input()
 
         # init loaders
         self.img_loader = AL.Img_Loader(self)
         self.snd_loader = AL.Snd_Loader(self)
+        self.font_loader = AL.Font_Loader(self)
+        self.text_cache = MS.Text_Cache(self)
+        self.startup_step("loaders")
+
+        # only the main menu's assets are loaded before the first frame, the
+        # rest are loaded while menus idle
+        self.load_assets([MSYS.Main])
+        self.level_assets_loaded = False
+        self.startup_step("main menu assets")
 
         # add screen's window name and icon
         pg.display.set_caption("Let's Make A Game provides the title for: The Castle of The Submarine Fortress")
+        self.perf_hud = PF.Perf_Hud(self, self.profiler)
         #pg.display.set_icon(self.img_loader.get("icon"))
 
-        # init screens other than level
-        self.main_screen = MSYS.Main(self)
-        self.start_screen = MSYS.Start(self)
-        self.pause_screen = MSYS.Pause(self)
-        self.fail_screen = MSYS.Fail(self)
+        # other screens are built when they're first shown
+        self.get_screen("main")
+        self.startup_step("main menu")
         self.level_clear_screen = False
-        self.end_screen = MSYS.End(self)
         self.level = False
 
         self.level_no = 1
+        self.next_level = False # built while the level clear screen idles
 
-        # load and play background music
-        self.music = self.snd_loader.get("Vexento - Lotus.mp3")
+        # stream and play background music
+        self.music = AL.Music_Channel(self, self.config.music_playlist)
         self.load_snd_vol()
-        self.music.play(loops = -1)
+        self.music.play()
+        self.startup_step("music")
 
         # # push main menu onto game state stack
         self.game_state_stack.append(self.main_screen.tick)
         #self.start_level()
 
+        # benchmarks construct the game without running it
+        if not autorun:
+            return
+
         # call run
-        self.run()
+        if headless:
+            self.run_headless(level_count)
+        else:
+            self.run()
 
         # after running terminates, close
+        if profile:
+            self.profiler.dump()
         pg.quit()
 
     def run(self):
         # main loop
         clock = pg.time.Clock()
         while len(self.game_state_stack) > 0:
+            # a screen still showing since last frame that had nothing happen
+            # sleeps until an event wakes it
+            screen = self.game_state_stack[-1].__self__
+            if screen.idle and self.game_state_stack[-1] == self.last_tick \
+               and not self.perf_hud.visible and self.pending_size is None:
+                # use the spare time to build a screen before it's needed
+                with self.profiler.scope("idle"):
+                    if not self.warm_up_screen():
+                        self.input.wait(self.config.menu_idle_wait_ms)
+
             # calculate dt
+            fps = screen.max_fps
             if self.config.vsync:
-                # delay to achieve correct frame rate
-                dt = clock.tick(60)
-            else:
-                dt = clock.tick()
+                fps = min(fps, 60) if fps else 60
+            # delay to achieve correct frame rate
+            dt = clock.tick(fps)
 
-            # event collect events
-            event_list = list(pg.event.get())
+            with self.profiler.scope("frame"):
+                # event collect events
+                with self.profiler.scope("events"):
+                    event_list = self.input.get_events()
 
-            # check events
-            for event in event_list:
-                # close event: close the game
-                if event.type == pg.QUIT:
-                    pass#return
+                # check events
+                for event in event_list:
+                    # close event: close the game
+                    if event.type == pg.QUIT:
+                        pass#return
                 
-                # rescale events: change size of the screen
-                elif event.type == pg.VIDEORESIZE:
-                    if self.config.rescaleable:
-                        self.config.resolution = event.size
-                        self.rescale()
+                    # rescale events: change size of the screen
+                    # dragging the window sends many, so only keep the last
+                    elif event.type == pg.VIDEORESIZE:
+                        if self.config.rescaleable:
+                            self.pending_size = event.size
+                            self.resize_time = pg.time.get_ticks()
 
-            self.screen.fill((255,255,255))
-            # call correct tick function
-            self.game_state_stack[-1](event_list, dt)
+                    # F3 toggles the performance overlay
+                    elif event.type == pg.KEYUP and event.key == pg.K_F3:
+                        self.perf_hud.toggle()
+                        # redraw everything under the overlay
+                        self.last_tick = None
 
-            pg.display.flip()
+                    # uncovered or restored windows may have lost what was
+                    # drawn, so draw everything again
+                    elif event.type in (pg.WINDOWEXPOSED, pg.VIDEOEXPOSE,
+                                        pg.WINDOWRESTORED):
+                        self.last_tick = None
 
-    def start_level(self):
+                    # music events: move on to the next track
+                    else:
+                        self.music.handle_event(event)
+
+                # resize once the window has stopped changing size
+                if self.pending_size is not None and pg.time.get_ticks() - \
+                   self.resize_time >= self.config.resize_settle_ms:
+                    self.config.resolution = self.pending_size
+                    self.pending_size = None
+                    self.rescale()
+
+                # screens only draw what changed unless they've just been
+                # shown or the overlay is drawn over them
+                tick = self.game_state_stack[-1]
+                self.refresh_screen(tick.__self__)
+                self.full_redraw = tick != self.last_tick or \
+                                   self.perf_hud.visible
+                self.last_tick = tick
+                self.dirty_rects = None
+
+                # call correct tick function
+                with self.profiler.scope("tick"):
+                    tick(event_list, dt)
+                self.perf_hud.draw(dt)
+
+                with self.profiler.scope("flip"):
+                    if self.dirty_rects is None:
+                        pg.display.flip()
+                    elif self.dirty_rects:
+                        pg.display.update(self.dirty_rects)
+
+            if "first frame" not in self.startup_times.keys():
+                self.startup_step("first frame")
+                self.report_startup()
+
+            self.profiler.end_frame()
+
+    def run_headless(self, level_count):
+        """plays level_count levels back to back with scripted input and a
+        fixed dt, as fast as the cpu allows"""
+        dt = self.config.headless_dt
+        rng.seed(self.config.headless_seed)
+
+        self.report_startup()
+
+        frames = 0
+        results = {"cleared": 0, "failed": 0}
+        start = time.perf_counter()
 
-        # initialise new level
-        self.level = MSYS.Level(self, self.level_no)
-        self.level.setup()
+        for i in range(level_count):
+            # cycle through the levels
+            self.level_no = i % len(self.config.level_hit_requirements) + 1
+            # levels pop the screen bellow them when they are cleared
+            self.game_state_stack = [self.main_screen.tick]
+            self.start_level()
+            level = self.level
+
+            # step the level until it pushes another screen
+            while self.game_state_stack and \
+                  self.game_state_stack[-1] == level.tick:
+                with self.profiler.scope("tick"):
+                    level.tick(self.input.get_events(), dt)
+                if self.render_enabled:
+                    pg.display.flip()
+                self.profiler.end_frame()
+                frames += 1
+
+            if level.hits >= \
+               self.config.level_hit_requirements[level.level_no-1]:
+                results["cleared"] += 1
+            else:
+                results["failed"] += 1
+
+        # report simulation speed
+        wall_time = time.perf_counter() - start
+        sim_time = frames * dt / 1000
+        print(f"headless: {level_count} levels ({results['cleared']} cleared, "
+              f"{results['failed']} failed), {frames} frames")
+        print(f"headless: simulated {sim_time:.1f}s in {wall_time:.2f}s, "
+              f"{sim_time / wall_time:.1f} simulated seconds per wall second")
+
+    @property
+    def main_screen(self):
+        return self.get_screen("main")
+
+    @property
+    def start_screen(self):
+        return self.get_screen("start")
+
+    @property
+    def pause_screen(self):
+        return self.get_screen("pause")
+
+    @property
+    def fail_screen(self):
+        return self.get_screen("fail")
+
+    @property
+    def end_screen(self):
+        return self.get_screen("end")
+
+    def get_screen(self, name):
+        """returns (Ui_Screen) the named screen, building it on first use"""
+        if name not in self.screens.keys():
+            self.screens[name] = self.screen_classes[name](self)
+        return self.screens[name]
+
+    def warm_up_screen(self):
+        """builds the next level while its level clear screen is shown, else
+        the next screen which hasn't been built yet, then loads the level's
+        assets, returns (bool) if there was anything left to do"""
+        if not self.config.warm_up_screens:
+            return False
+        if self.level_clear_screen and not self.next_level and \
+           self.game_state_stack[-1] == self.level_clear_screen.tick:
+            self.next_level = self.build_level()
+            return True
+        for name in self.screen_classes.keys():
+            if name not in self.screens.keys():
+                self.get_screen(name)
+                return True
+        if not self.level_assets_loaded:
+            self.load_assets([MSYS.Level])
+            self.level_assets_loaded = True
+            return True
+        return False
+
+    def load_assets(self, screen_classes):
+        """loads the assets used by screen_classes, decoding them in parallel
+        when preloading is on"""
+        if self.config.preload_assets:
+            AL.Preloader(self, screen_classes).run()
+            return
+        for screen_class in screen_classes:
+            for img_name in screen_class.img_names:
+                self.img_loader.get(img_name)
+            for snd_name in screen_class.snd_names:
+                self.snd_loader.get(snd_name)
+
+    def startup_step(self, name):
+        """records how long startup took since the last step"""
+        now = time.perf_counter()
+        self.startup_times[name] = now - self.startup_last
+        self.startup_last = now
+
+    def report_startup(self):
+        for name, seconds in self.startup_times.items():
+            print(f"startup: {name} in {seconds * 1000:.1f}ms")
+        total = self.startup_last - self.startup_begin
+        print(f"startup: {total * 1000:.1f}ms in total")
+
+    def build_level(self):
+        """returns (Level) the level for level_no, set up and ready to push"""
+        asteroid_count = self.config.asteroid_counts[self.level_no-1]
+        plan = LG.build_level_plan(self.level_no, rng.getrandbits(32),
+                                   asteroid_count)
+        level = MSYS.Level(self, self.level_no, plan)
+
+        # sprites find the level they belong to through self.level
+        current_level = self.level
+        self.level = level
+        level.setup()
+        self.level = current_level
+        return level
+
+    def start_level(self):
+        # use the level built while the level clear screen was idle
+        if self.next_level and self.next_level.level_no == self.level_no:
+            self.level = self.next_level
+        else:
+            self.level = self.build_level()
+        self.next_level = False
 
         # push tick function to game state stack
         self.game_state_stack.append(self.level.tick)
@@ -98,7 +349,7 @@ class Game():
             self.game_state_stack.append(self.end_screen.tick)
             self.level = 1
         else:
-            # next level screen
+            # next level screen, the next level is built while it idles
             self.level_clear_screen = MSYS.Level_clear(self, self.level_no)
             self.level_no += 1
             self.game_state_stack.append(self.level_clear_screen.tick)
@@ -129,15 +380,32 @@ class Game():
         pg.display.set_caption("Colour Between The Lines")
         pg.display.set_icon(self.img_loader.get("icon"))
 
-        # call rescale method of all screens
-        self.main_screen.rescale()
-        self.start_screen.rescale()
-        self.pause_screen.rescale()
-        self.fail_screen.rescale()
-        if self.end_screen:
-            self.end_screen.rescale()
-        if self.level:
-            self.level.rescale()
+        # every screen built so far is now the wrong size, but only the one
+        # being shown is rescaled now, the rest wait until they're shown
+        screens = [*self.screens.values(), self.level_clear_screen, self.level,
+                   self.next_level]
+        self.stale_screens = {screen for screen in screens
+                              if isinstance(screen, MSYS.Ui_Screen)}
+        if self.game_state_stack:
+            self.refresh_screen(self.game_state_stack[-1].__self__)
+
+    def refresh_screen(self, screen):
+        """rescales screen if the window changed size since it was shown"""
+        if screen in self.stale_screens:
+            self.stale_screens.discard(screen)
+            screen.rescale()
+
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--headless", action="store_true",
+                        help="run levels without a window, as fast as possible")
+    parser.add_argument("--levels", type=int, default=1,
+                        help="number of levels to play when headless")
+    parser.add_argument("--render", action="store_true",
+                        help="still draw frames when headless")
+    parser.add_argument("--profile", action="store_true",
+                        help="write frame time traces when the game closes")
+    args = parser.parse_args()
 
-Game()
\ No newline at end of file
+    Game(args.headless, args.levels, args.render, args.profile)
@@ -1,9 +1,25 @@
 import pygame as pg
 import random as rng
+import hashlib
+import os
+import zipfile
+from collections import deque
+from pathlib import Path
+import numpy as np
 import Sprites as sprites
 
-def check_collidable(sprite):
-        return  type(sprite).__name__ in ["Wall", "Block", "Gateway", "Exit"]
+# tile types stored in Maze.tiles
+EMPTY = 0
+WALL = 1
+BLOCK = 2
+GATEWAY = 3
+EXIT = 4
+KEY = 5
+CHECKPOINT = 6
+ENEMY = 7
+
+# indexed by tile type: 1 if the tile can't be walked through
+COLLIDABLE = bytes([0, 1, 1, 1, 1, 0, 0, 0])
 
 class Maze():
     def __init__(self, game, msize, seed):
@@ -14,7 +30,6 @@ class Maze():
 
         # initialise sprite groups
         self.all_sprites = pg.sprite.LayeredUpdates()
-        self.maze_walls = pg.sprite.Group()
         self.gateways = pg.sprite.Group()
         self.blocks = pg.sprite.Group()
         self.enemies = pg.sprite.Group()
@@ -25,16 +40,28 @@ class Maze():
         """initialises the self dependent aspects of the maze:
             sprite generation is dependent on this wall object aready having
             been constructed"""
+        # generation is skipped when this maze is already in the cache;
+        # unseeded mazes are different every time, so they are never cached
+        cache = Maze_Cache(self.game.config)
+        if self.seed is None:
+            self.generate()
+        elif not cache.load(self):
+            self.generate()
+            cache.save(self)
+
+        self.spawn_sprites()
+
+    def generate(self):
+        """generates the pure data parts of the maze: layout, tile grid, path
+        and entity placements"""
         # initialise RNG
         rng.seed(self.seed)
 
         # generate maze layout
         self.generate_layout()
 
-        # convert layout to wall sprites
-        def wall_gen(pos):
-            return sprites.Wall(self.game, pos)
-        self.layout_to_board(wall_gen)
+        # convert layout to a tile grid
+        self.layout_to_board()
 
         # find start to end path
         path_end = [self.end[0]-1, self.end[1]]
@@ -43,133 +70,179 @@ class Maze():
         # populate
         self.populate()
 
+    def spawn_sprites(self):
+        """creates the exit and entity sprites, and the static wall layer"""
+        # sprites on the board, keyed by (x, y); walls have no sprites as
+        # they are drawn by the static layer
+        self.sprite_lookup = {}
+
+        self.exit = sprites.Exit(self.game, self.end)
+        self.all_sprites.add(self.exit)
+        self.sprite_lookup[tuple(self.end)] = self.exit
+
+        # sprite class and group of each entity tile
+        entity_types = {
+            BLOCK: (sprites.Block, self.blocks),
+            GATEWAY: (sprites.Gateway, self.gateways),
+            KEY: (sprites.Key, self.keys),
+            CHECKPOINT: (sprites.Checkpoint, self.checkpoints),
+            ENEMY: (sprites.Enemy, self.enemies),
+        }
+        for tile, pos, colour in self.entities:
+            sprite_type, group = entity_types[tile]
+            if colour is None:
+                sprite = sprite_type(self.game, pos)
+            else:
+                sprite = sprite_type(self.game, pos, colour)
+            self.all_sprites.add(sprite)
+            group.add(sprite)
+            self.sprite_lookup[tuple(pos)] = sprite
+
+        # bake the walls into a static layer
+        wall_size = (self.game.config.walls_width_px,
+                     self.game.config.walls_height_px)
+        self.static_layer = sprites.Static_Layer(self.game, self.tiles,
+                            {WALL: (self.game.img_loader.get("wall"), wall_size)})
+
     def generate_layout(self):
         """generates a maze layout"""
-        # uses kruskal's algorithm to generate maze layout
-        # init layout array
-        layout = [list([True, True, x + y * self.msize[0]] 
-                 for x in range(0, self.msize[0])) 
-                 for y in range(0, self.msize[1])]
+        # uses kruskal's algorithm over a disjoint set to generate the layout
+        width, height = self.msize
 
-        # generate list of all unchecked walls bellow
-        unchecked_walls = []
+        # init layout array
+        layout = [list([True, True, x + y * width] 
+                 for x in range(0, width)) 
+                 for y in range(0, height)]
+
+        # disjoint set of zones, cells are indexed by x + y * width
+        parent = list(range(width * height))
+        rank = [0] * (width * height)
+
+        def find(node):
+            # find the root of node's zone
+            root = node
+            while parent[root] != root:
+                root = parent[root]
+            # path compression: point every node on the way at the root
+            while parent[node] != root:
+                parent[node], node = root, parent[node]
+            return root
+
+        # generate list of all walls bellow
         # - 1 stops it from checking bottom most walls
-        for y in range(0, self.msize[1]-1):
-            for x in range(0, self.msize[0]):
-                unchecked_walls.append([x,y,0])
-
-        # generate a list of unchecked walls on right
-        for y in range(0, self.msize[1]):
-            # - 1 stops it from checking right most walls
-            for x in range(0, self.msize[0]-1):
-                unchecked_walls.append([x,y,1])
-
-        # iterate over all walls randomly, removing them if possible
-        while len(unchecked_walls) > 0:
-            # select random wall
-            wall = rng.choice(unchecked_walls)
-            x = wall[0]
-            y = wall[1]
-            if wall[2]:  # is left right wall
-                zone1 = layout[y][x][2]
-                zone2 = layout[y][x+1][2]
-
-                # check if this wall merges zones
-                if zone1 != zone2:
-                    # delete this wall
-                    layout[y][x][1] = False
-
-                    # merge zones
-                    for row in layout:
-                        for node in row:
-                            if node[2] == zone2:
-                                node[2] = zone1
-
-            else:  # is up down wall
-                zone1 = layout[y][x][2]
-                zone2 = layout[y+1][x][2]
-
-                # check if this wall merges zones
-                if zone1 != zone2:
-                    # delete this wall
-                    layout[y][x][0] = False
-
-                    # merge zones
-                    for row in layout:
-                        for node in row:
-                            if node[2] == zone2:
-                                node[2] = zone1
-
-            # remove wall from unchecked walls
-            unchecked_walls.remove(wall)
+        walls = [(x, y, 0) for y in range(0, height-1) for x in range(0, width)]
+
+        # generate a list of walls on right
+        # - 1 stops it from checking right most walls
+        walls += [(x, y, 1) for y in range(0, height) for x in range(0, width-1)]
+
+        # iterate over all walls in a random order, removing them if possible;
+        # one shuffle draws from rng differently to picking walls one at a
+        # time, so a seed gives a different (but still repeatable) layout to
+        # older versions
+        rng.shuffle(walls)
+        for x, y, is_right in walls:
+            cell = x + y * width
+            neighbour = cell + 1 if is_right else cell + width
+            zone1 = find(cell)
+            zone2 = find(neighbour)
+
+            # check if this wall merges zones
+            if zone1 == zone2:
+                continue
+
+            # delete this wall
+            layout[y][x][is_right] = False
+
+            # merge zones, attaching the shallower tree to the deeper one
+            if rank[zone1] < rank[zone2]:
+                zone1, zone2 = zone2, zone1
+            parent[zone2] = zone1
+            if rank[zone1] == rank[zone2]:
+                rank[zone1] += 1
+
+        # store each cell's final zone
+        for y in range(0, height):
+            for x in range(0, width):
+                layout[y][x][2] = find(x + y * width)
 
         # store layout to attribute
         self.layout = layout
 
-    def layout_to_board(self, wall_gen):
-        """converts the maze layout to a board and sprites"""
-        # adjust wall gen to append created walls to the correct groups
-        def wall_gen_group(start_pos):
-            wall = wall_gen(start_pos)
-            self.all_sprites.add(wall)
-            self.maze_walls.add(wall)
-            return wall
-
-        # generate board array
-        # initalise blank array
+    def layout_to_board(self):
+        """converts the maze layout to a tile grid"""
+        # generate tile grid, indexed by [y, x]
         bsize = [2 * self.msize[i] + 1 for i in (0,1)]
-        board = [list(False
-                for x in range(0, bsize[0]))
-                for y in range(0, bsize[1])]
-
-        # place perimiter sprites on board
-        for x in range(0, bsize[0]): # top and bottom edges
-            board[0][x] = wall_gen_group((x, 0))
-            board[bsize[1]-1][x] = wall_gen_group((x, bsize[1]-1))
-
-        for y in range(1, bsize[1]-2): # side edges
-            board[y][0] = wall_gen_group((0, y))
-            board[y][bsize[0]-1] = wall_gen_group((bsize[0]-1, y))
-        board[bsize[1]-2][0] = wall_gen_group((0, bsize[1]-2))
-
-        #place corner sprites on board
-        for y in range(2, bsize[1], 2):
-            for x in range(2, bsize[0], 2):
-                board[y][x] = wall_gen_group((x,y))
-
-        # place edge horizontal edge sprites on board
-        for ly in range(self.msize[1]-1):
-            for lx in range(self.msize[0]):
-                by = 2*ly + 1
-                bx = 2*lx + 1
-
-                if self.layout[ly][lx][0]: # wall bellow
-                    board[by+1][bx] = wall_gen_group((bx, by+1))
-
-        # place vertical edge sprites on board
-        for ly in range(self.msize[1]):
-            for lx in range(self.msize[0]-1):
-                by = 2*ly + 1
-                bx = 2*lx + 1
-
-                if self.layout[ly][lx][1]: # wall right
-                    board[by][bx+1] = wall_gen_group((bx+1, by))
-
-        self.board = board
-        self.bsize = bsize
+        tiles = np.zeros((bsize[1], bsize[0]), dtype=np.uint8)
+
+        # place perimiter walls, leaving a gap on the right for the exit
+        tiles[[0, -1], :] = WALL
+        tiles[:, [0, -1]] = WALL
+
+        # place corner walls
+        tiles[2::2, 2::2] = WALL
+
+        # place horizontal edge walls, from walls bellow (except the bottom row)
+        walls_below = np.array([[node[0] for node in row]
+                                for row in self.layout], dtype=bool)
+        tiles[2:-1:2, 1:-1:2][walls_below[:-1]] = WALL
+
+        # place vertical edge walls, from walls right (except the right column)
+        walls_right = np.array([[node[1] for node in row]
+                                for row in self.layout], dtype=bool)
+        tiles[1:-1:2, 2:-1:2][walls_right[:, :-1]] = WALL
+
+        self.set_tiles(tiles)
+
+        # place exit in board
+        self.set_cell(self.end, EXIT)
+
+    def set_tiles(self, tiles):
+        """stores a tile grid and the attributes derived from it"""
+        self.tiles = tiles
+        self.bsize = [tiles.shape[1], tiles.shape[0]]
+        # flat view of the tiles, indexed by x + y * bsize[0], for searches
+        self.tile_view = memoryview(tiles.reshape(-1))
+        # empty cells which entities can be placed on
+        self.free_index = Free_Cell_Index(tiles)
+        # entities placed on the board, as (tile, pos, colour or None)
+        self.entities = []
 
         # generate start
         self.start = [1, 1]
 
         # generate end
-        self.end = [bsize[0]-1, bsize[1]-2]
-        self.exit = sprites.Exit(self.game, self.end)
-        self.all_sprites.add(self.exit)
-        # place exit in board
-        self.board[-2][-1] = self.exit
+        self.end = [self.bsize[0]-1, self.bsize[1]-2]
+
+    def draw(self, surface):
+        """draws the static walls and then the maze's sprites"""
+        self.static_layer.draw(surface)
+        self.all_sprites.draw(surface)
+
+    def set_cell(self, pos, tile):
+        """places a tile on the board"""
+        self.tiles[pos[1], pos[0]] = tile
+        # keep the free cell index in sync
+        if tile == EMPTY:
+            self.free_index.add(pos)
+        else:
+            self.free_index.discard(pos)
+
+    def place_entity(self, pos, tile, colour=None):
+        """places an entity tile, recording it so its sprite can be spawned"""
+        self.set_cell(pos, tile)
+        self.entities.append((tile, tuple(pos), colour))
+
+    def is_collidable(self, pos):
+        """returns (bool) whether pos can't be walked through"""
+        return bool(COLLIDABLE[self.tiles[pos[1], pos[0]]])
+
+    def free_cells(self):
+        """returns (array) the (x, y) of every empty cell"""
+        return np.argwhere(self.tiles == EMPTY)[:, ::-1]
 
     def populate(self):
-        """populates the maze with sprites"""
+        """chooses where the maze's entities go"""
         # populate gateways and blocks
 
         path_len = len(self.start_to_end_path)
@@ -193,20 +266,14 @@ class Maze():
             remaining_colours.remove(block_colour)
             allowed_colours.append(block_colour)
 
-            block = sprites.Block(self.game, branch_node, block_colour)
-            self.board[branch_node[1]][branch_node[0]] = block
-            self.all_sprites.add(block)
-            self.blocks.add(block)
+            self.place_entity(branch_node, BLOCK, block_colour)
 
             # conditionally set gateway to next node along path
             if rng.random() > self.game.config.maze_gateway_skip_threshold:
                 gateway_colour = rng.choice(allowed_colours)
                 allowed_colours.remove(gateway_colour)
 
-                gateway = sprites.Gateway(self.game, next_node, gateway_colour)
-                self.board[next_node[1]][next_node[0]] = gateway
-                self.all_sprites.add(gateway)
-                self.gateways.add(gateway)
+                self.place_entity(next_node, GATEWAY, gateway_colour)
 
             # increase node_index
             node_index += path_len * \
@@ -217,110 +284,225 @@ class Maze():
 
         # populate keys
         for _ in range(self.game.config.maze_key_count):
-            pos = self.random_board_spot()
-            while self.board[pos[1]][pos[0]] != False:
-                pos = self.random_board_spot()
-
-            key = sprites.Key(self.game, pos)
-            self.board[pos[1]][pos[0]] = key
-            self.all_sprites.add(key)
-            self.keys.add(key)
+            pos = self.free_index.sample()
+            self.place_entity(pos, KEY)
 
         # populate checkpoints
         for _ in range(self.game.config.maze_checkpoint_count):
-            pos = self.random_board_spot()
-            while self.board[pos[1]][pos[0]] != False:
-                pos = self.random_board_spot()
-
-            checkpoint = sprites.Checkpoint(self.game, pos)
-            self.board[pos[1]][pos[0]] = checkpoint
-            self.all_sprites.add(checkpoint)
-            self.checkpoints.add(checkpoint)
+            pos = self.free_index.sample()
+            self.place_entity(pos, CHECKPOINT)
 
         # populate enemies
         for _ in range(self.game.config.maze_enemy_count):
-            pos = self.random_board_spot()
-            while self.board[pos[1]][pos[0]] != False:
-                pos = self.random_board_spot()
+            pos = self.free_index.sample()
+            self.place_entity(pos, ENEMY)
+
+    def search(self, start, visited, stop_threshold=None):
+        """breadth first search over the tile grid from the flat index start,
+        skipping flat indices marked in visited (bytearray)
+        returns (list) parent of each reached index, (int) last index searched"""
+        width = self.bsize[0]
+        tiles = self.tile_view
+        parents = [-1] * len(tiles)
+
+        # same neighbour order as (0,-1), (0,1), (1,0), (-1,0)
+        offsets = (-width, width, 1, -1)
+
+        nodes_to_search = deque([start])
+        while nodes_to_search:
+            current_node = nodes_to_search.popleft()
+
+            for offset in offsets:
+                neighbour = current_node + offset
+                # check neighbour is a wall or has already been searched
+                if COLLIDABLE[tiles[neighbour]] or visited[neighbour]:
+                    continue
 
-            enemy = sprites.Enemy(self.game, pos)
-            self.board[pos[1]][pos[0]] = enemy
-            self.all_sprites.add(enemy)
-            self.enemies.add(enemy)
+                # new node; mark as visited and append to nodes_to_search
+                visited[neighbour] = 1
+                parents[neighbour] = current_node
+                nodes_to_search.append(neighbour)
+
+            # optionally stop searching at random
+            if stop_threshold is not None and rng.random() < stop_threshold:
+                break
+
+        return parents, current_node
 
     def get_shortest_path(self, start, end):
         """returns (list) path from start to end"""
-        # dijkstra's algorithm
+        # breadth first search
 
         # trivial path
         if start == end:
             return [start]
 
-        # place start node in nodes to search
-        nodes_to_search = [tuple(start)]
-        known_nodes = {tuple(start): False}
-
-        while len(nodes_to_search) > 0:
-            current_node_pos = nodes_to_search.pop(0)
-
-            for offset in [(0,-1), (0,1), (1,0), (-1,0)]:
-                neighbour = tuple([current_node_pos[i] + offset[i] for i in (0,1)])
-                # check neighbour is a wall
-                if check_collidable(self.board[neighbour[1]][neighbour[0]]):
-                    continue
+        width = self.bsize[0]
+        start_index = start[0] + start[1] * width
+        end_index = end[0] + end[1] * width
 
-                # check neighbour has already been searched
-                if neighbour in known_nodes.keys():
-                    continue
+        visited = bytearray(len(self.tile_view))
+        visited[start_index] = 1
+        parents, _ = self.search(start_index, visited)
 
-                # new node; add to known nodes and append to nodes_to_search
-                known_nodes[tuple(neighbour)] = current_node_pos
-                nodes_to_search.append(neighbour)
+        # use parents to construct a path from end to start
+        if parents[end_index] == -1:
+            return [end]
 
-        # use known nodes to construct a path from end to start
         end_to_start = []
-        current_node = tuple(end)
-        if tuple(current_node) in known_nodes.keys():
-            while known_nodes[tuple(current_node)] != False:
-                end_to_start.append(current_node)
-                current_node = known_nodes[current_node]
-            
-            end_to_start.append(start)
-
-            # reverse end_to_start to get start_to_end
-            return end_to_start[::-1]
-        else:
-            return([end])
+        current_node = end_index
+        while current_node != start_index:
+            end_to_start.append((current_node % width, current_node // width))
+            current_node = parents[current_node]
+        end_to_start.append(start)
+
+        # reverse end_to_start to get start_to_end
+        return end_to_start[::-1]
 
     def branch(self, start_node, known_nodes):
         """branches out from a start node to another node in the maze"""
-
-        nodes_to_search = [start_node]
-
-        while len(nodes_to_search) > 0:
-
-            current_node_pos = nodes_to_search.pop(0)
-
-            for offset in [(0,-1), (0,1), (1,0), (-1,0)]:
-                neighbour = [current_node_pos[i] + offset[i] for i in (0,1)]
-                neighbour = tuple(neighbour)
-                # check neighbour is a wall
-                if check_collidable(self.board[neighbour[1]][neighbour[0]]):
-                    continue
-
-                # check neighbour has already been searched
-                if neighbour in known_nodes:
-                    continue
-
-                # new node; add to known nodes and append to nodes_to_search
-                known_nodes.append(neighbour)
-                nodes_to_search.append(neighbour)
-
-            if rng.random() < self.game.config.maze_branch_stop_threshold:
-                break
-
-        return current_node_pos
-
-    def random_board_spot(self):
-        """returns (tuple) random point on the board"""
-        return [rng.randint(0, self.bsize[i]-1) for i in [0,1]]
+        width = self.bsize[0]
+        start_index = start_node[0] + start_node[1] * width
+
+        # known nodes are never branched into
+        visited = bytearray(len(self.tile_view))
+        for node in known_nodes:
+            visited[node[0] + node[1] * width] = 1
+
+        _, end_index = self.search(start_index, visited,
+                        self.game.config.maze_branch_stop_threshold)
+
+        if end_index == start_index:
+            return start_node
+        return (end_index % width, end_index // width)
+
+
+class Free_Cell_Index():
+    """the empty cells of a tile grid, supporting O(1) uniform sampling
+    without replacement"""
+    def __init__(self, tiles):
+        self.width = tiles.shape[1]
+        # flat indices of free cells, and where each one is in that list
+        self.cells = np.flatnonzero(tiles.reshape(-1) == EMPTY).tolist()
+        self.positions = {cell: i for i, cell in enumerate(self.cells)}
+
+    def __len__(self):
+        return len(self.cells)
+
+    def add(self, pos):
+        cell = pos[0] + pos[1] * self.width
+        if cell not in self.positions.keys():
+            self.positions[cell] = len(self.cells)
+            self.cells.append(cell)
+
+    def discard(self, pos):
+        cell = pos[0] + pos[1] * self.width
+        if cell in self.positions.keys():
+            # move the last cell into the removed cell's slot
+            i = self.positions.pop(cell)
+            last = self.cells.pop()
+            if last != cell:
+                self.cells[i] = last
+                self.positions[last] = i
+
+    def sample(self):
+        """returns (list) a random free cell, which is then no longer free"""
+        cell = self.cells[rng.randrange(len(self.cells))]
+        pos = [cell % self.width, cell // self.width]
+        self.discard(pos)
+        return pos
+
+
+class Maze_Cache():
+    """on disk cache of generated mazes, keyed by everything generation
+    depends on, with least recently used files evicted over a size cap"""
+    version = 1
+
+    def __init__(self, config):
+        self.config = config
+        self.cache_path = Path(self.config.maze_cache_pathX)
+
+    def file_path(self, maze):
+        """returns (Path) the cache file for a maze's inputs"""
+        maze_config = sorted((identifier, val) for identifier, val
+                             in self.config.__dict__.items()
+                             if identifier.startswith("maze_") and
+                             not identifier.startswith("maze_cache"))
+        key = repr((self.version, tuple(maze.msize), maze.seed, maze_config))
+        return self.cache_path / (hashlib.sha1(key.encode()).hexdigest() + ".npz")
+
+    def load(self, maze):
+        """fills in maze's data from the cache, returns (bool) if it was hit"""
+        file_path = self.file_path(maze)
+        try:
+            with np.load(file_path) as data:
+                width, height = maze.msize
+                walls = np.unpackbits(data["layout_bits"])[:width * height * 2]
+                walls = walls.reshape(height, width, 2).tolist()
+                zone = int(data["zone"])
+                maze.layout = [[[bool(node[0]), bool(node[1]), zone]
+                                for node in row] for row in walls]
+
+                maze.set_tiles(data["tiles"].copy())
+
+                # get_shortest_path starts its path with the start or end list
+                # it was given, followed by tuples
+                path = [tuple(node) for node in data["path"].tolist()]
+                path[0] = list(path[0])
+                maze.start_to_end_path = path
+
+                maze.entities = [(tile, (x, y), None if colour < 0 else colour)
+                                 for tile, x, y, colour
+                                 in data["entities"].tolist()]
+        except (OSError, KeyError, ValueError):
+            return False
+        except zipfile.BadZipFile:
+            # corrupt or half written file; generate the maze again instead
+            file_path.unlink(missing_ok=True)
+            return False
+
+        # mark as recently used
+        os.utime(file_path)
+        return True
+
+    def save(self, maze):
+        """writes maze's data to the cache, then evicts old files"""
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+        file_path = self.file_path(maze)
+
+        walls = np.array([[node[:2] for node in row] for row in maze.layout],
+                         dtype=bool)
+        entities = np.array([(tile, pos[0], pos[1], -1 if colour is None
+                              else colour) for tile, pos, colour
+                             in maze.entities], dtype=np.int32).reshape(-1, 4)
+
+        # write to a temporary file first so a crash never leaves half a file
+        temp_path = file_path.with_suffix(".tmp")
+        try:
+            with open(temp_path, "wb") as cache_file:
+                np.savez_compressed(cache_file,
+                    layout_bits=np.packbits(walls),
+                    zone=np.int64(maze.layout[0][0][2]),
+                    tiles=maze.tiles,
+                    path=np.array(maze.start_to_end_path, dtype=np.int32),
+                    entities=entities)
+            os.replace(temp_path, file_path)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        """removes least recently used files until the cache fits its cap"""
+        # temporary files left behind by interrupted saves
+        for temp_path in self.cache_path.glob("*.tmp"):
+            temp_path.unlink(missing_ok=True)
+
+        files = sorted(self.cache_path.glob("*.npz"),
+                       key=lambda file_path: file_path.stat().st_mtime)
+        total = sum(file_path.stat().st_size for file_path in files)
+        while files and total > self.config.maze_cache_max_bytes:
+            oldest = files.pop(0)
+            total -= oldest.stat().st_size
+            oldest.unlink()
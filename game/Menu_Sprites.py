@@ -1,5 +1,5 @@
 import pygame as pg
-from pathlib import Path
+from collections import OrderedDict
 
 vec2 = pg.math.Vector2
 
@@ -8,19 +8,63 @@ k2c_alpha_lower = [chr(i) for i in range(ord("a"), ord("z")+1)]
 k2c_alpha_upper = [chr(i) for i in range(ord("A"), ord("Z")+1)]
 k2c_all = ["all"]
 
+class Text_Cache():
+    """shared LRU cache of rendered lines of text, scaled to their height;
+    single characters are cached the same way to build text that changes
+    often from glyphs"""
+    def __init__(self, game):
+        self.game = game
+        self.max_size = self.game.config.text_cache_size
+        self.lines = OrderedDict()
+
+    def get_line(self, font, line, colour, line_height):
+        """returns (surface) line rendered and scaled to line_height"""
+        key = (font, line, colour, line_height)
+        if key in self.lines.keys():
+            self.lines.move_to_end(key)
+            return self.lines[key]
+
+        text_img = font.render(line, False, colour)
+        # fonts are sized to the line, so this only corrects rounding
+        if text_img.get_height() != line_height:
+            scale_factor = line_height / text_img.get_height()
+            text_size = [text_img.get_width() * scale_factor, line_height]
+            text_img = pg.transform.scale(text_img, text_size)
+
+        # store, evicting the least recently used line
+        self.lines[key] = text_img
+        if len(self.lines) > self.max_size:
+            self.lines.popitem(last=False)
+        return text_img
+
+    def get_atlas_line(self, font, line, colour, line_height):
+        """returns (surface) line built from cached glyphs, so changing
+        digits never re-renders or re-scales anything"""
+        glyphs = [self.get_line(font, char, colour, line_height)
+                  for char in line]
+
+        # blit the glyphs side by side
+        width = sum(glyph.get_width() for glyph in glyphs)
+        text_img = pg.surface.Surface((width, line_height), flags=pg.SRCALPHA)
+        x = 0
+        for glyph in glyphs:
+            text_img.blit(glyph, (x, 0))
+            x += glyph.get_width()
+        return text_img
+
+
 class Text(pg.sprite.Sprite):
-    def __init__(self, game, start_rect, text):
+    def __init__(self, game, start_rect, text, atlas=False):
         super().__init__()
         # store text to attribute
         self.game = game
         self.text = text
+        # hud text which changes often is built from a glyph atlas
+        self.atlas = atlas
+        self.rendered_key = None
 
-        # get font name
-        font_name = "OLDENGL.TTF"
-        font_path = Path(self.game.config.img_pathX) / font_name
-
-        # load font
-        self.font = pg.font.Font(font_path.as_posix(), 20)
+        # fonts are shared, and sized to the rect when rendering
+        self.font_name = self.game.config.menu_font_name
         self.text_colour = self.game.config.text_colour
 
         # rescale to generate image
@@ -33,18 +77,27 @@ class Text(pg.sprite.Sprite):
         pass
 
     def rescale(self):
+        # the image only needs rendering when the text or size has changed
+        key = (self.text, tuple(self.rect.size), self.text_colour)
+        if key == self.rendered_key:
+            return
+        self.rendered_key = key
+
         # render text to image
         # split text by lines
         lines = self.text.split("\n")
 
         self.image = pg.surface.Surface(self.rect.size, flags=pg.SRCALPHA)
+        line_height = self.rect.height / len(lines)
+        font = self.game.font_loader.get_for_height(self.font_name, line_height)
         for i, line in enumerate(lines):            
-            line_height = self.rect.height / len(lines)
-
-            text_img = self.font.render(line, False, self.text_colour)
-            scale_factor = line_height / text_img.get_height()
-            text_size = [text_img.get_width() * scale_factor, line_height]
-            text_img = pg.transform.scale(text_img, text_size)
+            # fetch the rendered line from the shared cache
+            if self.atlas:
+                text_img = self.game.text_cache.get_atlas_line(font, line,
+                                            self.text_colour, line_height)
+            else:
+                text_img = self.game.text_cache.get_line(font, line,
+                                            self.text_colour, line_height)
             text_img_rect = text_img.get_rect()
 
             # scale image to width and height of rect
@@ -63,12 +116,8 @@ class Input_Box(pg.sprite.Sprite):
         self.allowed_keys = allowed_keys
         self.selected = False
 
-        # get font name
-        font_name = "OLDENGL.TTF"
-        font_path = Path(self.game.config.img_pathX) / font_name
-
-        # load font
-        self.font = pg.font.Font(font_path.as_posix(), 20)
+        # fonts are shared, and sized to the rect when rendering
+        self.font_name = self.game.config.menu_font_name
         self.text_colour = self.game.config.text_colour
 
         # rescale to generate image
@@ -110,10 +159,10 @@ class Input_Box(pg.sprite.Sprite):
             render_text = self.default_text
 
         # render text to image
-        text_img = self.font.render(render_text, False, self.text_colour)
-        scale_factor = self.rect.height / text_img.get_height()
-        text_size = [text_img.get_width() * scale_factor, self.rect.height]
-        text_img = pg.transform.scale(text_img, text_size)
+        font = self.game.font_loader.get_for_height(self.font_name,
+                                                    self.rect.height)
+        text_img = self.game.text_cache.get_line(font, render_text,
+                                        self.text_colour, self.rect.height)
         text_img_rect = text_img.get_rect()
 
         # scale image to width and height of rect
@@ -230,12 +279,8 @@ class Spinner(pg.sprite.Sprite):
         self.options = options
         self.index = 0
 
-        # get font name
-        font_name = self.game.config.text_font_name
-        font_path = Path(self.game.config.img_pathX) / font_name
-
-        # load font
-        self.font = pg.font.Font(font_path.as_posix(), 20)
+        # fonts are shared, and sized to the rect when rendering
+        self.font_name = self.game.config.text_font_name
         self.text_colour = self.game.config.text_colour
 
         # load images and sounds
@@ -271,12 +316,11 @@ class Spinner(pg.sprite.Sprite):
         # blit image
         self.image = pg.transform.scale(self.arrows_img, self.rect.size)
 
-        text_img = self.font.render(self.options[self.index], 
-                                        False, self.text_colour)
-        # rescale text to fit screen
-        scale_factor = self.rect.height / text_img.get_height()
-        text_size = [text_img.get_width() * scale_factor, self.rect.height]
-        text_img = pg.transform.scale(text_img, text_size)
+        # render text at the height of the rect
+        font = self.game.font_loader.get_for_height(self.font_name,
+                                                    self.rect.height)
+        text_img = self.game.text_cache.get_line(font, self.options[self.index],
+                                        self.text_colour, self.rect.height)
         text_img_rect = text_img.get_rect()
 
         # button rects
@@ -302,12 +346,8 @@ class Button(pg.sprite.Sprite):
         self.game = game
         self.text = text
 
-        # get font name
-        font_name = "OLDENGL.TTF"
-        font_path = Path(self.game.config.img_pathX) / font_name
-
-        # load font
-        self.font = pg.font.Font(font_path.as_posix(), 20)
+        # fonts are shared, and sized to the rect when rendering
+        self.font_name = self.game.config.menu_font_name
         self.text_colour = self.game.config.text_colour
 
         self.click_snd = self.game.snd_loader.get("click.mp3")
@@ -354,12 +394,11 @@ class Button(pg.sprite.Sprite):
             pg.draw.rect(self.image, (255,255,255), (3,3,self.rect.width-3,
                                             self.rect.height-3), 3)
 
-        # render text
-        text_img = self.font.render(self.text, False, self.text_colour)
-        # rescale text to fit screen
-        scale_factor = self.rect.height / text_img.get_height()
-        text_size = [text_img.get_width() * scale_factor, self.rect.height]
-        text_img = pg.transform.scale(text_img, text_size)
+        # render text at the height of the rect
+        font = self.game.font_loader.get_for_height(self.font_name,
+                                                    self.rect.height)
+        text_img = self.game.text_cache.get_line(font, self.text,
+                                        self.text_colour, self.rect.height)
         text_img_rect = text_img.get_rect()
 
         # blit text
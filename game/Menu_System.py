@@ -2,6 +2,8 @@ from turtle import screensize
 import pygame as pg
 import Menu_Sprites as MS
 import Sprites as sprites
+import Physics as phys
+import Level_Gen as LG
 import Maze_Gen as mg
 import random as rng
 
@@ -9,6 +11,10 @@ vec2 = pg.math.Vector2
 default_rect = lambda : pg.rect.Rect(0,0,1,1)
 
 class Ui_Screen():
+    # assets the screen loads, so they can be decoded before it is built
+    img_names = []
+    snd_names = ["click.mp3"]
+
     def __init__(self, game):
         self.game = game
 
@@ -17,16 +23,81 @@ class Ui_Screen():
 
         self.screen = self.game.screen
 
+        # static screens only redraw the elements which changed
+        self.dirty_rendering = True
+        self.full_redraw = True
+        self.drawn = {} # element: (image, rect) as last drawn
+
+        # frame scheduling: menus run slowly, and sleep when nothing happens
+        self.max_fps = self.game.config.menu_fps
+        self.animated = False
+        self.idle = False
+
     def tick(self, event_list, dt):
-        self.elements.update(dt, event_list)
-        if self.background:
-            self.game.screen.blit(self.bg_img, self.bg_rect)
+        # elements only change on input, so a still screen can wait for some
+        self.idle = not (event_list or self.animated)
+
+        with self.game.profiler.scope("ui.update"):
+            self.elements.update(dt, event_list)
+        # headless runs can skip drawing
+        if not self.game.render_enabled:
+            return
+        with self.game.profiler.scope("ui.draw"):
+            if self.dirty_rendering and self.game.config.dirty_rects and \
+               not (self.full_redraw or self.game.full_redraw):
+                self.game.dirty_rects = self.draw_dirty()
+            else:
+                self.draw()
+            self.full_redraw = False
+
+    def draw(self):
+        """redraws the whole screen"""
+        self.game.screen.fill((255,255,255))
+        self.draw_background(self.game.screen.get_rect())
         self.elements.draw(self.game.screen)
 
+        self.drawn = {element: (element.image, element.rect.copy())
+                      for element in self.elements}
+
+    def draw_dirty(self):
+        """redraws the elements whose image or rect changed since they were
+        last drawn, returns (list) the rects of the screen that changed"""
+        dirty = []
+        for element in self.elements:
+            drawn = self.drawn.get(element)
+            if drawn is None or drawn[0] is not element.image:
+                dirty.append(element.rect.copy())
+            # moved elements also uncover where they used to be
+            if drawn is not None and drawn[1] != element.rect:
+                dirty += [drawn[1], element.rect.copy()]
+
+        # clear each rect to the background and redraw everything over it
+        for rect in dirty:
+            self.game.screen.set_clip(rect)
+            self.game.screen.fill((255,255,255))
+            self.draw_background(rect)
+            for element in self.elements:
+                if element.rect.colliderect(rect):
+                    self.game.screen.blit(element.image, element.rect)
+        self.game.screen.set_clip(None)
+
+        for element in self.elements:
+            self.drawn[element] = (element.image, element.rect.copy())
+        return dirty
+
+    def draw_background(self, rect):
+        """blits the part of the background image under rect"""
+        if self.background:
+            area = rect.move(-self.bg_rect.x, -self.bg_rect.y)
+            self.game.screen.blit(self.bg_img, rect.topleft, area)
+
     def rescale(self):
         screen_rect = pg.rect.Rect(0, 0, *self.screen.get_size())
         screen_size = vec2(screen_rect.size)
 
+        # everything moves, so the next frame is drawn from scratch
+        self.full_redraw = True
+
         # rescale the background if it is present
         if self.background:
             # choose scale factor to fill screen
@@ -47,6 +118,8 @@ class Ui_Screen():
             elements.rescale()
 
 class Main(Ui_Screen):
+    img_names = ["main background"]
+
     def __init__(self, game):
         super().__init__(game)
 
@@ -111,6 +184,8 @@ class Main(Ui_Screen):
         super().rescale()
 
 class Start(Ui_Screen):
+    img_names = ["main background"]
+
     def __init__(self, game):
         super().__init__(game)
 
@@ -149,6 +224,8 @@ class Start(Ui_Screen):
         super().rescale()
 
 class Level_clear(Ui_Screen):
+    img_names = ["main background"]
+
     def __init__(self, game, level_no):
         super().__init__(game)
 
@@ -187,6 +264,8 @@ class Level_clear(Ui_Screen):
         super().rescale()
 
 class Fail(Ui_Screen):
+    img_names = ["main background"]
+
     def __init__(self, game):
         super().__init__(game)
 
@@ -225,6 +304,8 @@ class Fail(Ui_Screen):
         super().rescale()
 
 class End(Ui_Screen):
+    img_names = ["main background"]
+
     def __init__(self, game):
         super().__init__(game)
 
@@ -263,6 +344,8 @@ class End(Ui_Screen):
         super().rescale()
 
 class Pause(Ui_Screen):
+    img_names = ["menu background"]
+
     def __init__(self, game):
         super().__init__(game)
 
@@ -331,33 +414,55 @@ class Pause(Ui_Screen):
         super().rescale()
 
 class Level(Ui_Screen):
-    def __init__(self, game, level_no):
+    img_names = ["spaceship1.png", "Cannon.png", "spaceship2.png",
+                 "Background.png", "Gold.png", "Coal.png", "Apple.png",
+                 "Ice.png", *sorted(set(LG.asteroid_img_names))]
+    snd_names = ["winfretless.ogg"]
+
+    def __init__(self, game, level_no, plan):
         super().__init__(game)
 
         
         # init UI elements
         self.level_text = MS.Text(game, default_rect(), f"LEVEL : {level_no}")
         self.elements.add(self.level_text)
-        self.hits_text = MS.Text(game, default_rect(), f"resources delivered: 0")
+        self.hits_text = MS.Text(game, default_rect(), f"resources delivered: 0",
+                                 atlas=True)
         self.elements.add(self.hits_text)
-        self.time_text = MS.Text(game, default_rect(), f"time left: 0")
+        self.time_text = MS.Text(game, default_rect(), f"time left: 0",
+                                 atlas=True)
         self.elements.add(self.time_text)
 
         self.timer = sprites.Timer(self.game)
         self.level_no = level_no
+        self.plan = plan
         self.hits = 0
         self.time_left = 30
+        self.physics_time = 0 # simulation time not yet stepped, in ms
+        # sprites move every frame, so the level always redraws everything at
+        # the full frame rate
+        self.dirty_rendering = False
+        self.max_fps = 0
+        self.animated = True
         self.win_snd = game.snd_loader.get("winfretless.ogg")
     
     def setup(self):
         """sets up the level"""
         # initialise camera
         self.camera = sprites.Camera(self.game)
+        self.transform_cache = sprites.Transform_Cache(self.game)
+
+        # asteroids and resources are stepped together by the physics store
+        self.physics = phys.Kinematics_Store()
+        self.resource_hash = phys.Spatial_Hash(
+            self.game.config.collision_cell_size)
 
         # initialise sprite groups
         self.all_sprites = pg.sprite.Group()
         self.asteroids = pg.sprite.Group()
         self.resources = pg.sprite.Group()
+        self.resource_pool = sprites.Resource_Pool(
+            self.game, self.game.config.resource_pool_size)
 
         # initalise player spaceship
         self.ship_1 = sprites.Player_ship(self.game, (2, 2.5))
@@ -369,19 +474,15 @@ class Level(Ui_Screen):
         # initialise other spaceship
         self.ship_2 = sprites.Other_ship(self.game, (8, 2.5))
         self.all_sprites.add(self.ship_2)
-        # initialise asteroids
-        for _ in range(self.game.config.asteroid_counts[self.level_no-1]):
-            ast = sprites.Asteroid(self.game)
+        # initialise asteroids from the plan's spawn table
+        for spawn in self.plan.asteroid_spawns:
+            ast = sprites.Asteroid(self.game, spawn)
             self.asteroids.add(ast)
             self.all_sprites.add(ast)
 
         self.rescale()
 
     def tick(self, events, dt):
-        self.time_left -= dt/1000
-        self.time_text.text = f"time left: {round(self.time_left)}s"
-        self.time_text.rescale()
-
         for event in events:
             if event.type == pg.KEYUP:
                 if event.key == pg.K_ESCAPE:
@@ -396,21 +497,89 @@ class Level(Ui_Screen):
                     self.camera.zoom = max(self.camera.zoom-1 , 1)
                 self.rescale()
 
-        # update all sprites
-        self.all_sprites.update(dt)
-        self.camera.update(dt)
-        self.timer.update(dt)
+        # run the simulation in fixed steps, carrying left over time over to
+        # the next frame
+        step = 1000 / self.game.config.physics_rate
+        self.physics_time += dt
+        steps = 0
+        with self.game.profiler.scope("level.physics"):
+            while self.physics_time >= step and \
+                  self.game.game_state_stack[-1] == self.tick:
+                # cap the steps per frame so slow frames can't snowball,
+                # dropping the whole steps still owed but keeping the
+                # fraction to interpolate with
+                if steps == self.game.config.physics_max_steps:
+                    self.physics_time %= step
+                    break
+                self.physics_tick(step)
+                self.physics_time -= step
+                steps += 1
+
+        self.time_text.text = f"time left: {round(self.time_left)}s"
+        self.time_text.rescale()
+
+        # call all sprites render method, drawing them between their last two
+        # physics states
+        alpha = min(self.physics_time / step, 1)
+        with self.game.profiler.scope("level.render"):
+            # transform every body in the physics store to the screen at once
+            screen_positions = self.camera.wrld_2_scrn_coords(
+                self.physics.lerp_pos(alpha))
+            for sprite in self.all_sprites:
+                sprite.render(dt, alpha, screen_positions)
+
+        super().tick(events, dt)
+
+        if False: # debug col rects
+            for sprite in self.all_sprites:
+                pg.draw.rect(self.game.screen, (0,0,255), sprite.rect, 1)
+                pg.draw.circle(self.game.screen, (0,255,0), sprite.rect.center, sprite.radius, 1)
+
+    def draw(self):
+        with self.game.profiler.scope("level.draw"):
+            self.game.screen.fill((32,32,32))
+            self.all_sprites.draw(self.game.screen)
+            self.elements.draw(self.game.screen)
+
+    def physics_tick(self, dt):
+        """advances the level by one fixed step of dt ms"""
+        self.time_left -= dt/1000
+
+        # remember the current state to render between it and the next one
+        for sprite in self.all_sprites:
+            sprite.save_state()
+
+        # step all kinematic sprites at once, then update the rest
+        with self.game.profiler.scope("level.update"):
+            for sprite in self.physics.step(dt):
+                sprite.out_of_bounds()
+            self.all_sprites.update(dt)
+            self.camera.update(dt)
+            self.timer.update(dt)
 
         # end game if they run out of time
         if self.time_left <=0:
             self.game.game_state_stack.append(self.game.fail_screen.tick)
 
-        # collide resources with asteroids:
-        for ast in self.asteroids:
-            pg.sprite.spritecollide(ast, self.resources, True, pg.sprite.collide_circle)
-        
-        # collide ship with resources
-        for hit in pg.sprite.spritecollide(self.ship_2, self.resources, True):
+        with self.game.profiler.scope("level.collisions"):
+            # move collision rects to the new positions
+            screen_positions = self.camera.wrld_2_scrn_coords(
+                self.physics.pos[:self.physics.count])
+            for sprite in self.all_sprites:
+                sprite.place(screen_positions)
+
+            # bucket resources so collisions only test nearby pairs
+            self.resource_hash.rebuild(self.resources)
+
+            # collide resources with asteroids:
+            for ast in self.asteroids:
+                self.resource_hash.spritecollide(ast, True,
+                                                 pg.sprite.collide_circle)
+
+            # collide ship with resources
+            hits = self.resource_hash.spritecollide(self.ship_2, True)
+
+        for hit in hits:
             self.hits += 1
             # update hits text
             self.hits_text.text = f"resources delivered: {self.hits}"
@@ -425,24 +594,13 @@ class Level(Ui_Screen):
                 # open level cleared dialogue
                 self.game.level_clear()
 
-        # call all sprites render method
-        for sprite in self.all_sprites:
-            sprite.render(dt)
-
-
-        self.game.screen.fill((32,32,32))
-        self.all_sprites.draw(self.game.screen)
-        super().tick(events, dt)
-
-        if False: # debug col rects
-            for sprite in self.all_sprites:
-                pg.draw.rect(self.game.screen, (0,0,255), sprite.rect, 1)
-                pg.draw.circle(self.game.screen, (0,255,0), sprite.rect.center, sprite.radius, 1)
-
     def rescale(self):
         screen_rect = pg.rect.Rect(0, 0, *self.screen.get_size())
         screen_size = vec2(screen_rect.size)
 
+        # cached sprite images are only valid for the old zoom level
+        self.transform_cache.clear()
+
         # level number:
         self.level_text.rect.width = screen_size.x * 0.15
         self.level_text.rect.height = screen_size.y * 0.05
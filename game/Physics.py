@@ -0,0 +1,152 @@
+import numpy as np
+
+
+class Kinematics_Store():
+    """holds the kinematics of many bodies in contiguous arrays so they can
+    all be stepped with one vectorised call per frame"""
+    def __init__(self, capacity=64):
+        self.count = 0 # number of rows ever handed out
+        self.free_rows = []
+        self.owners = [None] * capacity
+
+        # kinematics
+        self.pos = np.zeros((capacity, 2))
+        self.vel = np.zeros((capacity, 2))
+        self.rot = np.zeros(capacity)
+        self.rot_vel = np.zeros(capacity)
+        self.alive = np.zeros(capacity, dtype=bool)
+
+        # state before the last step, used to interpolate rendering
+        self.prev_pos = np.zeros((capacity, 2))
+        self.prev_rot = np.zeros(capacity)
+
+        # bodies leave the world when they reach these bounds
+        self.lo = np.full((capacity, 2), -np.inf)
+        self.hi = np.full((capacity, 2), np.inf)
+
+    def add(self, owner, pos=(0, 0), vel=(0, 0), rot=0, rot_vel=0,
+            lo=(-np.inf, -np.inf), hi=(np.inf, np.inf)):
+        """adds a body and returns (int) the row it is stored in"""
+        # reuse a freed row when possible
+        if self.free_rows:
+            row = self.free_rows.pop()
+        else:
+            if self.count == len(self.alive):
+                self.grow()
+            row = self.count
+            self.count += 1
+
+        self.owners[row] = owner
+        self.pos[row] = pos
+        self.prev_pos[row] = pos
+        self.vel[row] = vel
+        self.rot[row] = rot
+        self.prev_rot[row] = rot
+        self.rot_vel[row] = rot_vel
+        self.lo[row] = lo
+        self.hi[row] = hi
+        self.alive[row] = True
+        return row
+
+    def remove(self, row):
+        """frees a row so it can be reused by another body"""
+        self.alive[row] = False
+        self.owners[row] = None
+        self.free_rows.append(row)
+
+    def grow(self):
+        """doubles the capacity of every array"""
+        capacity = len(self.alive) * 2
+        self.owners += [None] * (capacity - len(self.owners))
+        for name in ["pos", "vel", "rot", "rot_vel", "alive", "lo", "hi",
+                     "prev_pos", "prev_rot"]:
+            old = getattr(self, name)
+            new = np.zeros((capacity, *old.shape[1:]), dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def lerp_pos(self, alpha):
+        """returns (array) the position of every row between its previous and
+        current state"""
+        n = self.count
+        prev_pos = self.prev_pos[:n]
+        return prev_pos + (self.pos[:n] - prev_pos) * alpha
+
+    def step(self, dt):
+        """advances every body by dt (ms) and returns (list) the owners of
+        bodies that have left their bounds"""
+        n = self.count
+        dt = dt / 1000
+
+        self.prev_pos[:n] = self.pos[:n]
+        self.prev_rot[:n] = self.rot[:n]
+        self.pos[:n] += self.vel[:n] * dt
+        self.rot[:n] += self.rot_vel[:n] * dt
+
+        # find live bodies which are out of bounds
+        pos = self.pos[:n]
+        out = ((pos <= self.lo[:n]) | (pos >= self.hi[:n])).any(axis=1)
+        out &= self.alive[:n]
+        return [self.owners[row] for row in np.flatnonzero(out)]
+
+
+class Spatial_Hash():
+    """uniform grid broadphase over the screen space rects of a sprite group"""
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.group = None
+        self.cells = {}
+
+    def cell_range(self, sprite):
+        """returns (range, range) the cells covered by a sprite"""
+        rect = sprite.rect
+        left, top, right, bottom = rect.left, rect.top, rect.right, rect.bottom
+
+        # make sure the collision circle is covered too
+        if (radius := getattr(sprite, "radius", None)) is not None:
+            left = min(left, rect.centerx - radius)
+            right = max(right, rect.centerx + radius)
+            top = min(top, rect.centery - radius)
+            bottom = max(bottom, rect.centery + radius)
+
+        cs = self.cell_size
+        return (range(int(left // cs), int(right // cs) + 1),
+                range(int(top // cs), int(bottom // cs) + 1))
+
+    def rebuild(self, group):
+        """re-inserts every sprite in group, called once per tick"""
+        self.group = group
+        self.cells = {}
+        for sprite in group:
+            xs, ys = self.cell_range(sprite)
+            for y in ys:
+                for x in xs:
+                    self.cells.setdefault((x, y), []).append(sprite)
+
+    def spritecollide(self, sprite, dokill, collided=None):
+        """same as pg.sprite.spritecollide against the hashed group, but only
+        tests sprites sharing a cell with sprite"""
+        # gather candidates without duplicates, in insertion order
+        candidates = {}
+        xs, ys = self.cell_range(sprite)
+        for y in ys:
+            for x in xs:
+                for other in self.cells.get((x, y), ()):
+                    candidates[other] = True
+
+        hits = []
+        for other in candidates:
+            # sprites killed earlier this tick are no longer in the group
+            if other not in self.group:
+                continue
+
+            if collided is None:
+                hit = sprite.rect.colliderect(other.rect)
+            else:
+                hit = collided(sprite, other)
+
+            if hit:
+                hits.append(other)
+                if dokill:
+                    other.kill()
+        return hits
@@ -0,0 +1,110 @@
+import csv
+import json
+import time
+from collections import deque
+from pathlib import Path
+import pygame as pg
+import Menu_Sprites as MS
+
+
+class Scope():
+    """times the code inside a with block and records it to the profiler"""
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name,
+                             (time.perf_counter() - self.start) * 1000)
+
+
+class Profiler():
+    """named scoped timers, keeping rolling percentiles of each"""
+    def __init__(self, game):
+        self.game = game
+        self.window = self.game.config.profiler_window
+        self.samples = {} # name -> recent times in ms
+        self.frame_no = 0
+
+        # every sample, written out by dump
+        self.dump_traces = False
+        self.trace = []
+
+    def scope(self, name):
+        return Scope(self, name)
+
+    def record(self, name, ms):
+        if name not in self.samples.keys():
+            self.samples[name] = deque(maxlen=self.window)
+        self.samples[name].append(ms)
+        if self.dump_traces:
+            self.trace.append((self.frame_no, name, ms))
+
+    def end_frame(self):
+        self.frame_no += 1
+
+    def stats(self):
+        """returns (dict) name -> {p50, p95, p99, mean} in ms"""
+        stats = {}
+        for name, samples in self.samples.items():
+            ordered = sorted(samples)
+            percentile = lambda p: ordered[min(int(len(ordered) * p),
+                                               len(ordered) - 1)]
+            stats[name] = {"p50": percentile(0.5), "p95": percentile(0.95),
+                           "p99": percentile(0.99),
+                           "mean": sum(ordered) / len(ordered)}
+        return stats
+
+    def dump(self):
+        """writes the trace to csv and the summary statistics to json"""
+        trace_path = Path(self.game.config.profiler_trace_pathX)
+
+        with open(trace_path.with_suffix(".csv"), "w", newline="") as trace_file:
+            writer = csv.writer(trace_file)
+            writer.writerow(["frame", "scope", "ms"])
+            writer.writerows(self.trace)
+
+        with open(trace_path.with_suffix(".json"), "w") as stats_file:
+            json.dump({"frames": self.frame_no, "scopes": self.stats()},
+                      stats_file, indent=2)
+
+        print(f"profiler: wrote {len(self.trace)} samples to "
+              f"{trace_path.with_suffix('.csv')}")
+
+
+class Perf_Hud():
+    """toggleable overlay of the profiler's statistics"""
+    def __init__(self, game, profiler):
+        self.game = game
+        self.profiler = profiler
+        self.visible = False
+        self.refresh_countdown = 0
+
+        self.text = MS.Text(game, pg.rect.Rect(0, 0, 1, 1), "")
+
+    def toggle(self):
+        self.visible = not self.visible
+        self.refresh_countdown = 0
+
+    def draw(self, dt):
+        if not self.visible:
+            return
+
+        # re-rendering text is slow, so only refresh a few times a second
+        self.refresh_countdown -= dt
+        if self.refresh_countdown <= 0:
+            self.refresh_countdown = self.game.config.profiler_hud_refresh_ms
+            lines = ["scope  p50  p95  p99 (ms)"]
+            for name, stat in self.profiler.stats().items():
+                lines.append(f"{name}  {stat['p50']:.2f}  {stat['p95']:.2f}  "
+                             f"{stat['p99']:.2f}")
+
+            self.text.text = "\n".join(lines)
+            self.text.rect.size = (self.game.screen.get_width() * 0.4,
+                                   len(lines) * 20)
+            self.text.rescale()
+
+        self.game.screen.blit(self.text.image, self.text.rect)
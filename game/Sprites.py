@@ -1,8 +1,11 @@
 import math
 import random as rng
 import time
+from collections import OrderedDict
 from numpy import size
+import numpy as np
 import pygame as pg
+import Level_Gen as LG
 
 vec2 = pg.math.Vector2
 
@@ -10,6 +13,48 @@ def collide_hit_rect(one, two):
     return one.hit_rect.colliderect(two.hit_rect)
 
 
+class Transform_Cache():
+    """shared LRU cache of scaled and rotated sprite images"""
+    def __init__(self, game):
+        self.game = game
+        self.max_size = self.game.config.render_cache_size
+        self.rot_step = self.game.config.render_cache_rot_step
+
+        # scaled bases are keyed by (source, size), rotated images by
+        # (source, size, quantized angle)
+        self.scaled = {}
+        self.rotated = OrderedDict()
+
+    def get(self, image, scale, rot):
+        # size of the scaled base, rounded the same way transform.scale does
+        size = tuple(int(oord * scale) for oord in image.get_size())
+        # quantize the angle so slowly spinning sprites share images
+        angle = round(rot / self.rot_step) * self.rot_step % 360
+        key = (image, size, angle)
+
+        # cache hit: mark as most recently used
+        if key in self.rotated:
+            self.rotated.move_to_end(key)
+            return self.rotated[key]
+
+        # scale the base once per zoom level
+        if (image, size) not in self.scaled:
+            self.scaled[(image, size)] = pg.transform.scale(image, size)
+        scaled_img = self.scaled[(image, size)]
+
+        # rotate and store, evicting the least recently used image
+        rotated_img = pg.transform.rotate(scaled_img, angle)
+        self.rotated[key] = rotated_img
+        if len(self.rotated) > self.max_size:
+            self.rotated.popitem(last=False)
+        return rotated_img
+
+    def clear(self):
+        """drops all cached images, called when the zoom changes"""
+        self.scaled.clear()
+        self.rotated.clear()
+
+
 class Renderable_Sprite(pg.sprite.Sprite):
     def __init__(self, game, start_pos=(0,0), start_rot=0):
         super().__init__()
@@ -17,6 +62,7 @@ class Renderable_Sprite(pg.sprite.Sprite):
         # initialise 
         self.game = game
         self.camera = self.game.level.camera
+        self.transform_cache = self.game.level.transform_cache
         self.pos = vec2(start_pos)
         self.rot = start_rot
         self.layer = int(self.pos.y)
@@ -29,11 +75,35 @@ class Renderable_Sprite(pg.sprite.Sprite):
         self.frame_countdown = 0
         self.culling = True
 
+        self.save_state()
+
         
     def update(self, dt):
         pass
 
-    def render(self, dt):
+    def save_state(self):
+        """stores pos and rot before a physics step, for interpolation"""
+        self.prev_pos = vec2(self.pos)
+        self.prev_rot = self.rot
+
+    def lerp_state(self, alpha):
+        """returns (vec2, float) pos and rot between the previous and current
+        physics states"""
+        return (self.prev_pos.lerp(self.pos, alpha),
+                self.prev_rot + (self.rot - self.prev_rot) * alpha)
+
+    def screen_pos(self, pos, screen_positions=None):
+        """returns the screen space position of pos"""
+        return self.camera.wrld_2_scrn_coord(pos)
+
+    def place(self, screen_positions=None):
+        """moves rect to the current pos without rerendering, so collisions
+        are correct between renders"""
+        screen_pos = self.screen_pos(self.pos, screen_positions)
+        self.rect.center = screen_pos
+        self.hit_rect.bottomleft = screen_pos
+
+    def render(self, dt, alpha=1, screen_positions=None):
         # decrease frame_countdown 
         self.frame_countdown -= dt
         # advance to next frame if less than 0
@@ -41,7 +111,8 @@ class Renderable_Sprite(pg.sprite.Sprite):
             self.frame_countdown = self.frame_time
             self.frame_index = (self.frame_index + 1) % len(self.imgs)
 
-        screen_pos = self.camera.wrld_2_scrn_coord(self.pos)
+        pos, rot = self.lerp_state(alpha)
+        screen_pos = self.screen_pos(pos, screen_positions)
 
         # retrieve correct img from imgs
         self.image = self.imgs[self.frame_index]
@@ -49,21 +120,19 @@ class Renderable_Sprite(pg.sprite.Sprite):
         # rotating and scaling images is expensive; only do it if the sprite
         # is visible on screen; this makes the game faster at higher zooms
         if self.culling == False or \
-           screen_pos.x-300 < (ssize := self.game.screen.get_size())[0] and \
-           screen_pos.x+300 > 0 and \
-           screen_pos.y-300 < ssize[1] and \
-           screen_pos.y+300 > 0:
-            # rotate and scale image 
-            self.image = pg.transform.scale(self.image, [oord*self.camera.zoom*self.zoom_scaler
-                                            for oord in self.image.get_size()])
-            self.image = pg.transform.rotate(self.image, self.rot)
+           screen_pos[0]-300 < (ssize := self.game.screen.get_size())[0] and \
+           screen_pos[0]+300 > 0 and \
+           screen_pos[1]-300 < ssize[1] and \
+           screen_pos[1]+300 > 0:
+            # rotate and scale image, reusing previously transformed images
+            self.image = self.transform_cache.get(self.image,
+                                    self.camera.zoom*self.zoom_scaler, rot)
 
         # set rect position correctly
         self.rect = self.image.get_rect()
         self.rect.center = screen_pos
 
         # place hit_rect position correctly
-        opp_corner = self.camera.wrld_2_scrn_coord(self.pos + vec2(1,-1))
         self.hit_rect = pg.rect.Rect(0,0,self.rect[2], self.rect[2])
         self.hit_rect.bottomleft = screen_pos
 
@@ -115,24 +184,22 @@ class Cannon(Renderable_Sprite):
         self.pos = self.game.level.ship_1.pos + vec2(0.12,0)
 
         # get direction towards mouse cursor
-        mouse_pos = pg.mouse.get_pos()
+        mouse_pos = self.game.input.get_mouse_pos()
         vec_to_mouse = vec2(mouse_pos) - vec2(self.rect.center)
         self.rot = vec_to_mouse.angle_to(vec2(0,1))
 
 
         # shoot of left click falling edge
-        mouse_button_states = pg.mouse.get_pressed()
+        mouse_button_states = self.game.input.get_mouse_pressed()
         if mouse_button_states[0] and not self.prev_mouse_states[0]:
-            # create resource:
-            reso = Resource(self.game, self.pos)
-            reso.vel = vec_to_mouse.normalize() * self.game.config.cannon_speed
-            self.game.level.all_sprites.add(reso)
-            self.game.level.resources.add(reso)
+            # fire a resource from the pool:
+            self.game.level.resource_pool.fire(self.pos,
+                vec_to_mouse.normalize() * self.game.config.cannon_speed)
         self.prev_mouse_states = mouse_button_states
         
 
-    def render(self, dt):
-        super().render(dt)
+    def render(self, dt, alpha=1, screen_positions=None):
+        super().render(dt, alpha, screen_positions)
 
 
 
@@ -169,10 +236,94 @@ class Other_ship(Renderable_Sprite):
         
         
 
-class Resource(Renderable_Sprite):
-    def __init__(self, game, start_pos=(0, 0), start_rot=0):
+class Kinematic_Sprite(Renderable_Sprite):
+    """sprite whose kinematics are a view over a row of the level's physics
+    store; the store steps all of these sprites in one call per frame"""
+    def __init__(self, game, start_pos=(0, 0), start_rot=0,
+                 lo=(-math.inf, -math.inf), hi=(math.inf, math.inf)):
+        # claim a row before the parent constructor sets pos and rot
+        self.physics = game.level.physics
+        self.bounds = (lo, hi)
+        self.row = self.physics.add(self, start_pos, (0, 0), start_rot, 0,
+                                    lo, hi)
         super().__init__(game, start_pos, start_rot)
 
+    @property
+    def pos(self):
+        return vec2(*self.physics.pos[self.row])
+
+    @pos.setter
+    def pos(self, val):
+        # setting pos directly is a teleport, so nothing is interpolated
+        self.physics.pos[self.row] = val
+        self.physics.prev_pos[self.row] = val
+
+    @property
+    def vel(self):
+        return vec2(*self.physics.vel[self.row])
+
+    @vel.setter
+    def vel(self, val):
+        self.physics.vel[self.row] = val
+
+    @property
+    def rot(self):
+        return float(self.physics.rot[self.row])
+
+    @rot.setter
+    def rot(self, val):
+        self.physics.rot[self.row] = val
+        self.physics.prev_rot[self.row] = val
+
+    @property
+    def rot_vel(self):
+        return float(self.physics.rot_vel[self.row])
+
+    @rot_vel.setter
+    def rot_vel(self, val):
+        self.physics.rot_vel[self.row] = val
+
+    def save_state(self):
+        # the physics store keeps the previous state
+        pass
+
+    def lerp_state(self, alpha):
+        prev_pos = self.physics.prev_pos[self.row]
+        prev_rot = self.physics.prev_rot[self.row]
+        pos = prev_pos + (self.physics.pos[self.row] - prev_pos) * alpha
+        rot = prev_rot + (self.physics.rot[self.row] - prev_rot) * alpha
+        return vec2(*pos), float(rot)
+
+    def screen_pos(self, pos, screen_positions=None):
+        # the level transforms every row of the store in one batch
+        if screen_positions is None:
+            return super().screen_pos(pos)
+        return screen_positions[self.row]
+
+    def out_of_bounds(self):
+        """called by the level when the physics store finds this sprite
+        outside its bounds"""
+        pass
+
+    def kill(self):
+        super().kill()
+        # give the row back to the store
+        if self.row is not None:
+            self.physics.remove(self.row)
+            self.row = None
+
+    def revive(self, pos, vel, rot, rot_vel):
+        """claims a new row for a killed sprite"""
+        self.row = self.physics.add(self, pos, vel, rot, rot_vel,
+                                    *self.bounds)
+
+
+class Resource(Kinematic_Sprite):
+    def __init__(self, game, start_pos=(0, 0), start_rot=0, pool=None):
+        # destroyed when it leaves the screen
+        super().__init__(game, start_pos, start_rot, (0, 0), (10, 5))
+        self.pool = pool
+
         # choose random rotation
         self.vel = vec2(0,0)
         self.rot_vel = rng.randint(-90, 90)
@@ -183,32 +334,95 @@ class Resource(Renderable_Sprite):
         self.zoom_scaler = 0.2
 
         self.render(0)
-    
-    def update(self, dt):
-        self.pos += self.vel * (dt/1000)
-        self.rot += self.rot_vel * (dt/1000)
 
+    def reset(self, pos, vel):
+        """prepares a pooled resource to be fired again"""
+        self.revive(pos, vel, 0, rng.randint(-90, 90))
+        self.frame_index = 0
+        self.frame_countdown = 0
+        self.render(0)
+
+    def out_of_bounds(self):
         # destroy if off screen
-        if  not  (0 < self.pos.x < 10 and 0 < self.pos.y < 5): 
-            self.kill()
+        self.kill()
 
-    def render(self, dt):
-        super().render(dt)
+    def kill(self):
+        was_alive = self.row is not None
+        super().kill()
+        # hand the resource back to the pool for reuse
+        if was_alive and self.pool:
+            self.pool.release(self)
 
+    def render(self, dt, alpha=1, screen_positions=None):
+        super().render(dt, alpha, screen_positions)
 
-class Asteroid(Renderable_Sprite):
-    def __init__(self, game):
-        super().__init__(game, (0,0), 0)
+
+class Resource_Pool():
+    """resources which are recycled by the cannon instead of constructing a
+    new resource for every shot; the pool fills as resources are killed, so
+    starting a level doesn't build any"""
+    def __init__(self, game, capacity):
+        self.game = game
+        self.capacity = capacity
+        self.free = []
+
+        # counters
+        self.hits = 0
+        self.misses = 0
+        self.live = 0
+        self.high_water_mark = 0
+
+    def fire(self, pos, vel):
+        """puts a resource into play and returns it"""
+        if self.free:
+            # recycle a dead resource
+            reso = self.free.pop()
+            reso.reset(pos, vel)
+            self.hits += 1
+        else:
+            # nothing to recycle yet; allocate
+            reso = Resource(self.game, pos, pool=self)
+            reso.vel = vel
+            self.misses += 1
+
+        self.game.level.all_sprites.add(reso)
+        self.game.level.resources.add(reso)
+
+        self.live += 1
+        self.high_water_mark = max(self.high_water_mark, self.live)
+        return reso
+
+    def release(self, reso):
+        """called when a resource is killed"""
+        self.live -= 1
+        # keep the pool at its fixed capacity
+        if len(self.free) < self.capacity:
+            self.free.append(reso)
+
+
+class Asteroid(Kinematic_Sprite):
+    def __init__(self, game, spawn=None):
+        # respawns when it falls off the bottom of the screen
+        super().__init__(game, (0,0), 0, hi=(math.inf, 6))
 
         # load assets with weighting by number
-        img_names = ["Evil Asteroid.png"]   * 1 + \
-                    ["Girder Deb.png"]      * 1 + \
-                    ["Minidebs.png"]        * 2 + \
-                    ["Ministorid.png"]      * 3 
-        self.possible_imgs = [game.img_loader.get(img_name) for img_name in img_names]
+        self.possible_imgs = [game.img_loader.get(img_name) for img_name
+                              in LG.asteroid_img_names]
         self.zoom_scaler = 0.2
 
-        self.respawn()
+        # first spawn comes from the level plan when there is one
+        if spawn:
+            self.spawn(*spawn)
+        else:
+            self.respawn()
+
+    def spawn(self, x, y, vel_y, rot_vel, img_index):
+        self.pos = (x, y)
+        self.vel = vec2(0, vel_y)
+        self.rot_vel = rot_vel
+
+        self.imgs = [self.possible_imgs[img_index]]
+        self.render(0)
     
     def respawn(self):
         self.pos = (rng.random()* 2 + 4, -1)
@@ -218,15 +432,9 @@ class Asteroid(Renderable_Sprite):
         self.imgs = [rng.choice(self.possible_imgs)]
         self.render(0)
 
-
-
-    def update(self, dt):
-        self.pos += self.vel * (dt/1000)
-        self.rot += self.rot_vel * (dt/1000)
-
+    def out_of_bounds(self):
         # respawn when off screen:
-        if(self.pos[1] > 6):
-            self.respawn()
+        self.respawn()
 
 
 class Camera():
@@ -242,6 +450,10 @@ class Camera():
         self.rect = self.img.get_rect()
         self.rect.topleft = (-1000,-1000)
 
+        # world to screen space transform, cached until the view changes
+        self.transform_key = None
+        self.affine = None
+
     
     def update(self, dt):
 
@@ -262,15 +474,106 @@ class Camera():
         # self.pos.x = min(max(left_edge, self.pos.x), right_edge)
         # self.pos.y = min(max(top_edge, self.pos.y), bottom_edge)
 
+    def transform(self):
+        """returns (scale, offset x, offset y) of the world to screen space
+        transform, only recalculated when the zoom, pos or resolution change"""
+        resolution = self.game.config.resolution
+        key = (self.zoom, self.pos.x, self.pos.y, resolution[0], resolution[1])
+        if key != self.transform_key:
+            self.transform_key = key
+            # ensures that the cameras position ends up at the centre of the
+            # screen
+            scale = self.zoom * 16
+            self.affine = (scale, resolution[0]/2 - self.pos.x * scale,
+                           resolution[1]/2 - self.pos.y * scale)
+        return self.affine
+
     def wrld_2_scrn_coord(self, wrld_coord):
         """takes a world space coordinate and converts it to screenspace"""
-        scrn_size = vec2(self.game.config.resolution)
+        scale, offset_x, offset_y = self.transform()
+        return vec2(wrld_coord[0] * scale + offset_x,
+                    wrld_coord[1] * scale + offset_y)
 
-        # ensures that the cameras position ends up at the centre of the screen
-        scaled_wrld_coord = vec2(wrld_coord) * self.zoom * 16
-        scaled_pos = self.pos * self.zoom * 16
-        ss_coord = scaled_wrld_coord + scrn_size/2 - scaled_pos
-        return ss_coord
+    def wrld_2_scrn_coords(self, wrld_coords):
+        """takes an (N, 2) array of world space coordinates and returns (array)
+        them all in screenspace"""
+        scale, offset_x, offset_y = self.transform()
+        return np.asarray(wrld_coords) * scale + (offset_x, offset_y)
+
+
+class Static_Layer():
+    """never moving tiles baked into chunked surfaces once per zoom level, so
+    they are drawn with a few blits rather than one sprite per tile"""
+    def __init__(self, game, tiles, tile_imgs):
+        self.game = game
+        self.tiles = tiles # tile grid, indexed by [y, x]
+        self.tile_imgs = tile_imgs # tile type -> (image, unzoomed px size)
+        self.chunk_size = self.game.config.static_chunk_size
+
+        self.zoom = None
+        self.chunks = {}
+
+    def rescale(self):
+        """rescales tile images and drops chunks baked at the old zoom"""
+        self.zoom = self.game.level.camera.zoom
+        self.tile_px = 16 * self.zoom
+        self.chunks = {}
+
+        # scale each tile image once
+        self.scaled_imgs = {}
+        for tile, (img, size) in self.tile_imgs.items():
+            self.scaled_imgs[tile] = pg.transform.scale(img,
+                                        [oord * self.zoom for oord in size])
+
+        # number of cells an image can overhang its own cell by
+        largest = max([max(img.get_size()) for img in self.scaled_imgs.values()]
+                      + [0])
+        self.margin = math.ceil(largest / self.tile_px)
+
+    def bake_chunk(self, cx, cy):
+        """returns (surface) the chunk at chunk coord cx, cy or False if empty.
+        layer pixel 0,0 is the centre of tile 0,0"""
+        cs = self.chunk_size
+        tile_px = self.tile_px
+
+        # range of tiles which could overlap this chunk
+        x0 = max(0, math.floor(cx * cs / tile_px) - self.margin)
+        y0 = max(0, math.floor(cy * cs / tile_px) - self.margin)
+        x1 = min(self.tiles.shape[1], math.ceil((cx+1) * cs / tile_px) + self.margin)
+        y1 = min(self.tiles.shape[0], math.ceil((cy+1) * cs / tile_px) + self.margin)
+        if x0 >= x1 or y0 >= y1:
+            return False
+
+        chunk = pg.surface.Surface((cs, cs), flags=pg.SRCALPHA)
+        region = self.tiles[y0:y1, x0:x1]
+        # draw row by row so taller tiles overlap the row above
+        for y, x in np.argwhere(np.isin(region, list(self.scaled_imgs))).tolist():
+            img = self.scaled_imgs[region[y, x]]
+            img_rect = img.get_rect()
+            img_rect.center = ((x0 + x) * tile_px - cx * cs,
+                               (y0 + y) * tile_px - cy * cs)
+            chunk.blit(img, img_rect)
+        return chunk
+
+    def draw(self, surface):
+        camera = self.game.level.camera
+        if camera.zoom != self.zoom:
+            self.rescale()
+
+        # screen position of layer pixel 0,0
+        origin = camera.wrld_2_scrn_coord((0, 0))
+        cs = self.chunk_size
+        width, height = surface.get_size()
+
+        # only bake and blit chunks which are on screen
+        for cy in range(math.floor(-origin.y / cs),
+                        math.floor((height - origin.y) / cs) + 1):
+            for cx in range(math.floor(-origin.x / cs),
+                            math.floor((width - origin.x) / cs) + 1):
+                if (cx, cy) not in self.chunks.keys():
+                    self.chunks[(cx, cy)] = self.bake_chunk(cx, cy)
+                if chunk := self.chunks[(cx, cy)]:
+                    surface.blit(chunk, (origin.x + cx * cs, origin.y + cy * cs))
 
 
 class Timer():
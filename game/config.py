@@ -28,28 +28,67 @@ class Config():
         self.snd_pathX = (app_path / 'snd').as_posix()
         self.scoreboard_pathX = (exe_parent_path / 'scoreboard.csv').as_posix()
         self.settings_save_pathX = (exe_parent_path / 'settings.set')
+        self.profiler_trace_pathX = (exe_parent_path / 'profile').as_posix()
+        self.maze_cache_pathX = (exe_parent_path / 'maze_cache').as_posix()
 
         # graphics config
         self.resolution = [1366, 768]
         self.rescaleable = False
+        self.resize_settle_ms = 100 # wait for resizing to stop before rescaling
         self.fullscreen = False
         self.vsync = True
+        self.dirty_rects = True # menus only redraw the widgets that changed
+        self.menu_fps = 30 # frame rate cap on menus, 0 is uncapped
+        self.menu_idle_wait_ms = 250 # longest an idle menu sleeps for events
+        self.warm_up_screens = True # build unseen screens while menus idle
         self.camera_zoom = 2
+        self.render_cache_size = 1024
+        self.render_cache_rot_step = 2
+
+        # profiler
+        self.profiler_window = 300 # frames kept for percentiles
+        self.profiler_hud_refresh_ms = 500
+
+        # headless runs
+        self.headless_dt = 16
+        self.headless_seed = 0
 
         # sound
         self.game_vol = 1
         self.music_vol = 0.25
         self.player_step_snd_delay = 300
+        self.music_playlist = ["Vexento - Lotus.mp3"]
+        self.music_fade_ms = 2000
+
+        # assets
+        self.preload_assets = False # only faster with spare cores to decode on
+        self.preload_workers = 4
+        self.preload_report = False # print the time taken by every asset
 
         # fonts
+        self.menu_font_name = "OLDENGL.TTF"
+        self.text_font_name = "PixeloidMono-1G8ae.ttf"
         self.text_colour = (0xb3,0x7d,0x2e)
+        self.text_cache_size = 256
 
         # asteroids
         self.asteroid_counts = [8, 10, 14, 16]
         self.asteroid_speed_range = (1,3)
 
+        # physics
+        self.physics_rate = 120 # fixed steps per second
+        self.physics_max_steps = 8 # most steps run in one frame
+        self.collision_cell_size = 128
+
         # cannon speed
         self.cannon_speed = 5
+        self.resource_pool_size = 64
+
+        # maze
+        self.walls_width_px = 16
+        self.walls_height_px = 24
+        self.static_chunk_size = 512
+        self.maze_cache_max_bytes = 16 * 1024 * 1024
 
         # win conditions
         self.level_hit_requirements = [5, 7, 9, 11]